@@ -1,38 +1,29 @@
 from django.contrib import admin
-from .models import AuctionListing, Bid, Comment, WatchList
+from django.utils import timezone
+
+from .closing import close_auctions as close_listings
+from .models import AuctionListing, Bid, Comment
 
 # Register your models here.
+# Each action runs a fixed number of queries however many auctions are selected.
 def close_auctions(modeladmin, request, queryset):
-    for auction in queryset:
-        highest_bid = Bid.objects.filter(auction=auction).order_by('-amount').first()
-        if highest_bid:
-            auction.winner = highest_bid.bidder
-
-        auction.active = False
-        auction.save()
-        WatchList.objects.filter(listing=auction).delete()
+    close_listings(queryset)
 
 
 def active_auctions(modeladmin, request, queryset):
-    for auction in queryset:
-        auction.winner = None
-        auction.active = True
-        auction.save()
+    # A reopened auction whose end time has passed would refuse every bid
+    # and be closed again, so it runs without an end time
+    queryset.filter(ends_at__lte=timezone.now()).update(ends_at=None)
+    queryset.update(winner=None, active=True)
 
 
 def declare_winner(modeladmin, request, queryset):
-    for auction in queryset:
-        highest_bid = Bid.objects.filter(auction=auction).order_by('-amount').first()
-        if highest_bid:
-            auction.winner = highest_bid.bidder
-            auction.active = False
-            auction.save()
-
-            WatchList.objects.filter(listing=auction).delete()
+    # Only auctions with at least one bid have a winner
+    close_listings(queryset.filter(bids__isnull=False).distinct())
 
 
 class AuctionListingAdmin(admin.ModelAdmin):
-    list_display = ('title', 'user', 'starting_bid', 'active')
+    list_display = ('title', 'user', 'price', 'bid_count', 'active')
     actions = [close_auctions, declare_winner, active_auctions]
 
 declare_winner.short_description = "Declare winner for selected auctions"
@@ -44,4 +35,4 @@ active_auctions.short_description = "Activate a listing"
 
 admin.site.register(AuctionListing, AuctionListingAdmin)
 admin.site.register(Bid)
-admin.site.register(Comment)
\ No newline at end of file
+admin.site.register(Comment)
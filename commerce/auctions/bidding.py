@@ -0,0 +1,40 @@
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .events import publish_bid
+from .models import AuctionListing, Bid, WatchList
+from .watching import forget_watchlists
+
+
+# Every bid must be at least this much higher than the current price
+MIN_INCREMENT = Decimal("1")
+
+
+def place_bid(listing_id, user, amount):
+    """
+    Places a bid of a Decimal amount on an active listing that has not
+    reached its end time yet. The price check and the update happen in a
+    single conditional UPDATE, so two concurrent bids can never both win.
+    Returns True if the bid was accepted.
+    """
+    with transaction.atomic():
+        accepted = AuctionListing.objects.filter(
+            Q(ends_at__isnull=True) | Q(ends_at__gt=timezone.now()),
+            pk=listing_id, active=True, price__lte=amount - MIN_INCREMENT
+        ).update(price=amount, bid_count=F("bid_count") + 1, leader=user)
+        if not accepted:
+            return False
+
+        Bid.objects.create(auction_id=listing_id, bidder=user, amount=amount)
+
+        # Bidders watch the listings they bid on
+        WatchList.objects.bulk_create(
+            [WatchList(user=user, listing_id=listing_id)], ignore_conflicts=True)
+        transaction.on_commit(lambda: forget_watchlists([user.pk]))
+
+        # Update the price on open listing pages once the bid is saved
+        transaction.on_commit(lambda: publish_bid(listing_id, str(amount), user.username))
+    return True
@@ -0,0 +1,49 @@
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+
+from .models import AuctionListing, Bid, WatchList
+from .watching import forget_watchlists
+
+
+def close_auctions(listings):
+    """
+    Closes the active listings of a queryset with a fixed number of
+    queries, whatever the number of listings. The highest bidder of each
+    listing becomes its winner. Returns the number of listings closed.
+    """
+    ids = listings.values('id')
+    top_bids = Bid.objects.filter(auction=OuterRef('pk')).order_by('-amount', 'timestamp')
+    with transaction.atomic():
+        # Remove the listings from all watch lists first, while the
+        # queryset still matches them
+        watched = WatchList.objects.filter(listing__in=ids)
+        watchers = set(watched.values_list('user_id', flat=True))
+        watched.delete()
+        transaction.on_commit(lambda: forget_watchlists(watchers))
+
+        return AuctionListing.objects.filter(id__in=ids, active=True).update(
+            active=False, winner=Subquery(top_bids.values('bidder')[:1]))
+
+
+def close_expired_auctions(now=None, batch_size=1000):
+    """
+    Closes every active listing whose end time has passed, oldest first,
+    in batches of `batch_size`. Returns the number of listings closed.
+    """
+    now = now or timezone.now()
+    expired = AuctionListing.objects.filter(active=True, ends_at__lte=now).order_by('ends_at')
+    total = 0
+    while True:
+        ids = list(expired.values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return total
+        total += close_auctions(AuctionListing.objects.filter(id__in=ids))
+
+
+def next_expiry():
+    """
+    Returns the end time of the active listing that ends first, or None.
+    """
+    return (AuctionListing.objects.filter(active=True, ends_at__isnull=False)
+            .order_by('ends_at').values_list('ends_at', flat=True).first())
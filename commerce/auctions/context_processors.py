@@ -0,0 +1,10 @@
+from .watching import watched_listing_ids
+
+
+def watchlist(request):
+    """
+    Adds the number of watched listings for the badge in the layout.
+    """
+    if not request.user.is_authenticated:
+        return {}
+    return {"watchlist_count": len(watched_listing_ids(request.user))}
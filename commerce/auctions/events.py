@@ -0,0 +1,131 @@
+import asyncio
+import json
+import re
+import threading
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+# Seconds between comments sent to keep idle connections open
+KEEPALIVE = 15
+
+EVENTS_PATH = re.compile(r"^/listing/(\d+)/events$")
+
+
+class LocalBroker:
+    """
+    Delivers messages to subscribers in this process only. A broker
+    shared between processes (Redis pub/sub, for example) can replace it
+    through settings.AUCTIONS_BROKER if it has the same three methods.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+
+    def subscribe(self, channel):
+        """
+        Returns an asyncio.Queue that receives the messages published
+        to the channel. Must be called from the event loop.
+        """
+        queue = asyncio.Queue()
+        with self._lock:
+            self._subscribers.setdefault(channel, {})[queue] = asyncio.get_running_loop()
+        return queue
+
+    def unsubscribe(self, channel, queue):
+        with self._lock:
+            queues = self._subscribers.get(channel, {})
+            queues.pop(queue, None)
+            if not queues:
+                self._subscribers.pop(channel, None)
+
+    def publish(self, channel, message):
+        """
+        Sends a message to every subscriber of the channel. Safe to call
+        from any thread.
+        """
+        with self._lock:
+            queues = list(self._subscribers.get(channel, {}).items())
+        for queue, loop in queues:
+            loop.call_soon_threadsafe(queue.put_nowait, message)
+
+
+_broker = None
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        _broker = import_string(settings.AUCTIONS_BROKER)()
+    return _broker
+
+
+def listing_channel(listing_id):
+    return f"listing:{listing_id}"
+
+
+def publish_bid(listing_id, price, bidder):
+    """
+    Tells everyone viewing a listing about its new price, given as a
+    string such as "12.50".
+    """
+    get_broker().publish(listing_channel(listing_id), json.dumps({
+        "price": price,
+        "bidder": bidder,
+    }))
+
+
+async def listing_events(scope, receive, send, listing_id):
+    """
+    Streams the bids on a listing as Server-Sent Events until the client
+    disconnects.
+    """
+    broker = get_broker()
+    channel = listing_channel(listing_id)
+    queue = broker.subscribe(channel)
+
+    async def wait_for_disconnect():
+        while (await receive())["type"] != "http.disconnect":
+            pass
+
+    disconnect = asyncio.ensure_future(wait_for_disconnect())
+    try:
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", b"text/event-stream"),
+                (b"cache-control", b"no-cache"),
+            ],
+        })
+        while not disconnect.done():
+            message = asyncio.ensure_future(queue.get())
+            done, _ = await asyncio.wait({message, disconnect}, timeout=KEEPALIVE,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if message in done:
+                body = f"data: {message.result()}\n\n"
+            else:
+                message.cancel()
+                body = ": keepalive\n\n"
+            if not disconnect.done():
+                await send({"type": "http.response.body",
+                            "body": body.encode("utf-8"), "more_body": True})
+    finally:
+        broker.unsubscribe(channel, queue)
+        disconnect.cancel()
+
+
+def with_listing_events(application):
+    """
+    Wraps the Django ASGI application so /listing/<id>/events is served
+    as an event stream without tying up a Django worker thread.
+    """
+    async def router(scope, receive, send):
+        if scope["type"] == "http" and scope["method"] == "GET":
+            match = EVENTS_PATH.match(scope["path"])
+            if match:
+                return await listing_events(scope, receive, send, int(match.group(1)))
+        return await application(scope, receive, send)
+    return router
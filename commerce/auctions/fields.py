@@ -0,0 +1,68 @@
+import re
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+
+from django import forms
+from django.core.exceptions import ValidationError
+from django.db import models
+
+
+CENT = Decimal("0.01")
+
+# Plain positive amounts with at most two decimal places, e.g. 12 or 12.50
+AMOUNT = re.compile(r"^\d{1,13}(\.\d{1,2})?$")
+
+
+def parse_amount(text):
+    """
+    Returns the Decimal amount written in `text`, or None if it is not a
+    plain positive amount of dollars with at most two decimals.
+    """
+    text = (text or "").strip()
+    if not AMOUNT.match(text):
+        return None
+    return Decimal(text).quantize(CENT)
+
+
+def to_cents(value):
+    """
+    Converts an amount of dollars to a whole number of cents.
+    """
+    if isinstance(value, float):
+        value = repr(value)
+    return int((Decimal(value) * 100).to_integral_value(ROUND_HALF_UP))
+
+
+class MoneyField(models.BigIntegerField):
+    """
+    Stores an amount of dollars exactly, as a whole number of cents, so
+    database comparisons and indexes never see rounding errors. In Python
+    the value is a Decimal with two decimal places.
+    """
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return None
+        return Decimal(value).scaleb(-2)
+
+    def to_python(self, value):
+        if value is None or isinstance(value, Decimal):
+            return value
+        try:
+            return Decimal(repr(value) if isinstance(value, float) else value).quantize(CENT)
+        except (InvalidOperation, TypeError, ValueError):
+            raise ValidationError(f"'{value}' is not a valid amount.", code="invalid")
+
+    def get_prep_value(self, value):
+        if value is None or hasattr(value, "resolve_expression"):
+            return value
+        return to_cents(value)
+
+    def formfield(self, **kwargs):
+        # Skip the integer form fields of the parent classes
+        return models.Field.formfield(self, **{
+            "form_class": forms.DecimalField,
+            "max_digits": 15,
+            "decimal_places": 2,
+            "min_value": 0,
+            **kwargs,
+        })
@@ -1,7 +1,17 @@
 from django import forms
+from django.utils import timezone
 from .models import AuctionListing
 
 class AuctionListingForm(forms.ModelForm):
     class Meta:
         model = AuctionListing
-        fields = ['title', 'description', 'starting_bid', 'category']
+        fields = ['title', 'description', 'starting_bid', 'category', 'ends_at']
+        widgets = {
+            'ends_at': forms.DateTimeInput(attrs={'type': 'datetime-local'}),
+        }
+
+    def clean_ends_at(self):
+        ends_at = self.cleaned_data['ends_at']
+        if ends_at is not None and ends_at <= timezone.now():
+            raise forms.ValidationError("The auction must end in the future.")
+        return ends_at
@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from auctions.closing import close_expired_auctions, next_expiry
+
+
+class Command(BaseCommand):
+    help = "Closes auctions whose end time has passed."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--loop", action="store_true",
+                            help="Keep running and close auctions as they expire.")
+        parser.add_argument("--poll", type=float, default=30,
+                            help="Longest time in seconds to sleep between checks "
+                                 "when looping, so new listings are noticed.")
+
+    def handle(self, *args, **options):
+        while True:
+            closed = close_expired_auctions(batch_size=options["batch_size"])
+            if closed:
+                self.stdout.write(f"Closed {closed} auctions.")
+            if not options["loop"]:
+                return
+
+            # Sleep until the next auction ends, but not longer than --poll
+            delay = options["poll"]
+            ends_at = next_expiry()
+            if ends_at is not None:
+                delay = min(delay, max((ends_at - timezone.now()).total_seconds(), 0))
+            time.sleep(delay)
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:20
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+
+
+def fill_auction_state(apps, schema_editor):
+    """
+    Sets the price, bid count and leader of every listing from its bids
+    with a single UPDATE.
+    """
+    AuctionListing = apps.get_model('auctions', 'AuctionListing')
+    Bid = apps.get_model('auctions', 'Bid')
+    top_bids = Bid.objects.filter(auction=OuterRef('pk')).order_by('-amount', 'timestamp')
+    bid_counts = (Bid.objects.filter(auction=OuterRef('pk'))
+                  .values('auction').annotate(count=Count('pk')).values('count'))
+    AuctionListing.objects.update(
+        price=Coalesce(Subquery(top_bids.values('amount')[:1]), 'starting_bid'),
+        bid_count=Coalesce(Subquery(bid_counts), 0),
+        leader=Subquery(top_bids.values('bidder')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0011_auctionlisting_winner'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='auctionlisting',
+            name='bid_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='auctionlisting',
+            name='leader',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='leading', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='auctionlisting',
+            name='price',
+            field=models.FloatField(blank=True, default=0),
+            preserve_default=False,
+        ),
+        migrations.AlterField(
+            model_name='auctionlisting',
+            name='category',
+            field=models.CharField(choices=[('TOYS', 'Toys'), ('BOOK', 'Books')], max_length=4),
+        ),
+        migrations.AlterField(
+            model_name='comment',
+            name='listing',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='comments', to='auctions.auctionlisting'),
+        ),
+        migrations.RunPython(fill_auction_state, migrations.RunPython.noop),
+    ]
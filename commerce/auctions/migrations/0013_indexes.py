@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:15
+
+from django.db import migrations, models
+from django.db.models import Min
+
+
+def remove_duplicate_watchlist_items(apps, schema_editor):
+    """
+    Keeps only the first row of each (user, listing) pair so the unique
+    constraint can be added.
+    """
+    WatchList = apps.get_model('auctions', 'WatchList')
+    first_ids = (WatchList.objects.values('user', 'listing')
+                 .annotate(first=Min('id')).values('first'))
+    WatchList.objects.exclude(id__in=first_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0012_auctionlisting_price'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='auctionlisting',
+            index=models.Index(condition=models.Q(('active', True)), fields=['-id'], name='listing_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='auctionlisting',
+            index=models.Index(condition=models.Q(('active', True)), fields=['category', '-id'], name='listing_category_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bid',
+            index=models.Index(fields=['auction', '-amount'], name='bid_auction_amount_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bid',
+            index=models.Index(fields=['bidder', '-timestamp'], name='bid_bidder_timestamp_idx'),
+        ),
+        migrations.RunPython(remove_duplicate_watchlist_items, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='watchlist',
+            constraint=models.UniqueConstraint(fields=('user', 'listing'), name='unique_watchlist_item'),
+        ),
+    ]
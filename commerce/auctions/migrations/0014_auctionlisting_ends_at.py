@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0013_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='auctionlisting',
+            name='ends_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='auctionlisting',
+            index=models.Index(condition=models.Q(('active', True)), fields=['ends_at'], name='listing_ends_at_idx'),
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:19
+
+import auctions.fields
+from django.db import migrations
+from django.db.models import F, Max
+from django.db.models.functions import Round
+
+
+# Rows converted per UPDATE, so no single statement locks a huge table
+BATCH_SIZE = 10000
+
+MONEY_FIELDS = [
+    ('AuctionListing', ['starting_bid', 'price']),
+    ('Bid', ['amount']),
+]
+
+
+def update_in_batches(apps, convert):
+    """
+    Sets every money column to `convert(F(column))`, one range of ids at
+    a time.
+    """
+    for model_name, fields in MONEY_FIELDS:
+        model = apps.get_model('auctions', model_name)
+        last_id = model.objects.aggregate(last=Max('id'))['last'] or 0
+        for start in range(0, last_id + 1, BATCH_SIZE):
+            model.objects.filter(id__gte=start, id__lt=start + BATCH_SIZE).update(
+                **{field: convert(F(field)) for field in fields})
+
+
+def dollars_to_cents(apps, schema_editor):
+    update_in_batches(apps, lambda amount: Round(amount * 100))
+
+
+def cents_to_dollars(apps, schema_editor):
+    update_in_batches(apps, lambda amount: amount / 100.0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0014_auctionlisting_ends_at'),
+    ]
+
+    operations = [
+        # Convert while the columns still hold floats, then change type
+        migrations.RunPython(dollars_to_cents, cents_to_dollars),
+        migrations.AlterField(
+            model_name='auctionlisting',
+            name='price',
+            field=auctions.fields.MoneyField(blank=True),
+        ),
+        migrations.AlterField(
+            model_name='auctionlisting',
+            name='starting_bid',
+            field=auctions.fields.MoneyField(),
+        ),
+        migrations.AlterField(
+            model_name='bid',
+            name='amount',
+            field=auctions.fields.MoneyField(),
+        ),
+    ]
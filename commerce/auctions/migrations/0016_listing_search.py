@@ -0,0 +1,33 @@
+from django.db import migrations
+
+
+def create_index(apps, schema_editor):
+    """
+    Creates the FTS5 table used by auctions.search on SQLite and fills
+    it from the existing listings. Other databases search without it.
+    """
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS auctions_listing_fts "
+        "USING fts5(title, description, tokenize='unicode61 remove_diacritics 2')")
+    schema_editor.execute(
+        "INSERT INTO auctions_listing_fts (rowid, title, description) "
+        "SELECT id, title, description FROM auctions_auctionlisting")
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute("DROP TABLE IF EXISTS auctions_listing_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0015_money_in_cents'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -1,6 +1,8 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
 
+from .fields import MoneyField
+
 
 class User(AbstractUser):
     pass
@@ -15,21 +17,54 @@ class AuctionListing(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="lister")
     title = models.CharField(max_length=64)
     description = models.TextField()
-    starting_bid = models.FloatField()
+    starting_bid = MoneyField()
     active = models.BooleanField(default=True)
     winner = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name="winner")
+    # When the auction closes by itself, see closing.close_expired_auctions
+    ends_at = models.DateTimeField(null=True, blank=True)
+
+    # Current state of the auction, kept up to date by bidding.place_bid
+    price = MoneyField(blank=True)
+    bid_count = models.PositiveIntegerField(default=0)
+    leader = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name="leading")
+
+    class Meta:
+        # Filters on active=True are written as a bare "active" column,
+        # which SQLite only matches against an index with the same WHERE
+        # clause. Partial indexes also leave out the closed listings.
+        indexes = [
+            # Active listings, optionally by category, in id order
+            models.Index(fields=['-id'], condition=models.Q(active=True), name='listing_active_idx'),
+            models.Index(fields=['category', '-id'], condition=models.Q(active=True),
+                         name='listing_category_idx'),
+            # Active listings by end time, for closing.close_expired_auctions
+            models.Index(fields=['ends_at'], condition=models.Q(active=True),
+                         name='listing_ends_at_idx'),
+        ]
 
+    def save(self, *args, **kwargs):
+        # A new listing starts at its starting bid
+        if self.price is None:
+            self.price = self.starting_bid
+        super().save(*args, **kwargs)
     
     def __str__(self):
-        return f"{self.title}, {self.description}, {self.starting_bid}"
+        return f"{self.title}, {self.description}, {self.price}"
 
 
 class Bid(models.Model):
     auction = models.ForeignKey(AuctionListing, on_delete=models.CASCADE, related_name='bids')
     bidder = models.ForeignKey(User, on_delete=models.CASCADE, related_name="bids")
-    amount = models.FloatField()
+    amount = MoneyField()
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Highest bids of a listing and latest bids of a user
+            models.Index(fields=['auction', '-amount'], name='bid_auction_amount_idx'),
+            models.Index(fields=['bidder', '-timestamp'], name='bid_bidder_timestamp_idx'),
+        ]
+
     def __str__(self):
         return f"{self.bidder}: ${self.amount} on {self.auction.title}, at {self.timestamp.strftime('%H:%M')}"
     
@@ -48,5 +83,10 @@ class WatchList(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     listing = models.ForeignKey(AuctionListing, on_delete=models.CASCADE)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'listing'], name='unique_watchlist_item'),
+        ]
+
     def __str__(self):
-        return f"{self.listing.title}, {self.listing.starting_bid}"
\ No newline at end of file
+        return f"{self.listing.title}, {self.listing.price}"
\ No newline at end of file
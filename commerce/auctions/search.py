@@ -0,0 +1,126 @@
+import re
+
+from django.db import connection
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .fields import to_cents
+from .models import AuctionListing
+
+
+# SQLite FTS5 table over the title and description of every listing,
+# created by migration 0016. Its rowid is the listing id.
+FTS_TABLE = "auctions_listing_fts"
+
+# Title matches weigh more than description matches in the ranking
+TITLE_WEIGHT = 10.0
+DESCRIPTION_WEIGHT = 1.0
+
+TERM = re.compile(r"\w+")
+
+_fts_available = None
+
+
+def fts_available():
+    """
+    Returns True if the database has the FTS5 index. Other databases use
+    a slower but portable LIKE search instead.
+    """
+    global _fts_available
+    if _fts_available is None:
+        _fts_available = (connection.vendor == "sqlite"
+                          and FTS_TABLE in connection.introspection.table_names())
+    return _fts_available
+
+
+def search_terms(query):
+    return TERM.findall(query or "")[:10]
+
+
+def search_listings(query, category=None, min_price=None, max_price=None,
+                    limit=20, offset=0):
+    """
+    Returns up to `limit` active listings matching every word of the
+    query, best match first, skipping the first `offset` results.
+    Prices are Decimal amounts compared with the current price.
+    """
+    terms = search_terms(query)
+    if not terms:
+        return []
+    if fts_available():
+        return _search_fts(terms, category, min_price, max_price, limit, offset)
+    return _search_like(terms, category, min_price, max_price, limit, offset)
+
+
+def _search_fts(terms, category, min_price, max_price, limit, offset):
+    sql = [f"SELECT l.id FROM {FTS_TABLE} f "
+           "JOIN auctions_auctionlisting l ON l.id = f.rowid "
+           f"WHERE {FTS_TABLE} MATCH %s AND l.active"]
+    # Quote every term so words like AND or NOT are not read as operators
+    params = [" ".join(f'"{term}"' for term in terms)]
+    if category:
+        sql.append("AND l.category = %s")
+        params.append(category)
+    if min_price is not None:
+        sql.append("AND l.price >= %s")
+        params.append(to_cents(min_price))
+    if max_price is not None:
+        sql.append("AND l.price <= %s")
+        params.append(to_cents(max_price))
+    sql.append(f"ORDER BY bm25({FTS_TABLE}, %s, %s), l.id DESC LIMIT %s OFFSET %s")
+    params += [TITLE_WEIGHT, DESCRIPTION_WEIGHT, limit, offset]
+
+    with connection.cursor() as cursor:
+        cursor.execute(" ".join(sql), params)
+        ids = [row[0] for row in cursor.fetchall()]
+    listings = AuctionListing.objects.in_bulk(ids)
+    return [listings[id] for id in ids if id in listings]
+
+
+def _search_like(terms, category, min_price, max_price, limit, offset):
+    listings = AuctionListing.objects.filter(active=True)
+    for term in terms:
+        listings = listings.filter(Q(title__icontains=term) | Q(description__icontains=term))
+    if category:
+        listings = listings.filter(category=category)
+    if min_price is not None:
+        listings = listings.filter(price__gte=min_price)
+    if max_price is not None:
+        listings = listings.filter(price__lte=max_price)
+    # Rank listings by the number of terms found in their title
+    rank = sum((Case(When(title__icontains=term, then=Value(1)), default=Value(0),
+                     output_field=IntegerField()) for term in terms), Value(0))
+    return list(listings.annotate(rank=rank).order_by('-rank', '-id')[offset:offset + limit])
+
+
+def index_listing(listing):
+    """
+    Replaces the indexed title and description of a listing.
+    """
+    if not fts_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [listing.id])
+        cursor.execute(f"INSERT INTO {FTS_TABLE} (rowid, title, description) "
+                       "VALUES (%s, %s, %s)", [listing.id, listing.title, listing.description])
+
+
+def unindex_listing(listing_id):
+    if not fts_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [listing_id])
+
+
+@receiver(post_save, sender=AuctionListing)
+def listing_saved(sender, instance, created, update_fields, **kwargs):
+    # Saves that only touch other columns leave the text as it was
+    if update_fields is not None and not {'title', 'description'} & set(update_fields):
+        return
+    index_listing(instance)
+
+
+@receiver(post_delete, sender=AuctionListing)
+def listing_deleted(sender, instance, **kwargs):
+    unindex_listing(instance.id)
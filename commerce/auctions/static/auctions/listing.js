@@ -0,0 +1,16 @@
+// Show new bids on this listing as soon as they are placed
+document.addEventListener('DOMContentLoaded', function() {
+
+  const price = document.querySelector('#price');
+  if (!price || !window.EventSource) {
+    return;
+  }
+  let bids = parseInt(price.dataset.bids);
+
+  const events = new EventSource(price.dataset.events);
+  events.onmessage = (event) => {
+    const bid = JSON.parse(event.data);
+    bids += 1;
+    price.textContent = `Price: ${bid.price}$ (${bids} bid${bids === 1 ? '' : 's'})`;
+  };
+});
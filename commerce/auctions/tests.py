@@ -1,3 +1,501 @@
-from django.test import TestCase
+import random
+import threading
+import time
+from datetime import timedelta
+from unittest import skipUnless
+from decimal import Decimal
 
-# Create your tests here.
+from django.core.cache import cache
+from django.db import OperationalError, connection, connections
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+
+from .admin import active_auctions, declare_winner
+from .bidding import MIN_INCREMENT, place_bid
+from .closing import close_auctions, close_expired_auctions, next_expiry
+from .fields import parse_amount, to_cents
+from .forms import AuctionListingForm
+from .models import AuctionListing, Bid, Comment, User, WatchList
+from .search import _search_like, search_listings, search_terms
+from .watching import watched_listing_ids
+
+
+class QueryCountTests(TestCase):
+    """
+    Listing pages must run the same number of queries whatever the
+    number of listings, bids, comments and watched items.
+    """
+
+    def setUp(self):
+        self.owner = User.objects.create_user("owner", "owner@example.com", "password")
+        self.bidder = User.objects.create_user("bidder", "bidder@example.com", "password")
+        self.client.force_login(self.bidder)
+
+    def add_listings(self, count):
+        for i in range(count):
+            listing = AuctionListing.objects.create(
+                user=self.owner, title=f"Listing {i}", description="Something",
+                starting_bid=10, category="TOYS")
+            Bid.objects.create(auction=listing, bidder=self.bidder, amount=11)
+            Bid.objects.create(auction=listing, bidder=self.owner, amount=12)
+            Comment.objects.create(user=self.owner, listing=listing, text="Nice")
+            Comment.objects.create(user=self.bidder, listing=listing, text="Indeed")
+            WatchList.objects.create(user=self.bidder, listing=listing)
+        return listing
+
+    def assertConstantQueries(self, url, num):
+        """
+        Checks the page runs `num` queries with a little and with a lot
+        of data.
+        """
+        for count in (1, 20):
+            self.add_listings(count)
+            # The watch list badge comes from the cache once it is warm
+            cache.clear()
+            watched_listing_ids(self.bidder)
+            with self.assertNumQueries(num):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+
+    def test_index(self):
+        self.assertConstantQueries("/", 3)
+
+    def test_active_listings(self):
+        self.assertConstantQueries("/active_listings/", 4)
+
+    def test_watchlist(self):
+        self.assertConstantQueries("/watchlist", 3)
+
+    def test_listing(self):
+        # Comments on other listings must not be loaded
+        listing = self.add_listings(2)
+        for _ in range(20):
+            Bid.objects.create(auction=listing, bidder=self.bidder, amount=13)
+            Comment.objects.create(user=self.bidder, listing=listing, text="More")
+        cache.clear()
+        watched_listing_ids(self.bidder)
+        with self.assertNumQueries(5):
+            response = self.client.get(f"/listing/{listing.id}")
+        self.assertEqual(len(response.context["comments"]), 22)
+
+
+class MoneyTests(TestCase):
+    """
+    Amounts are stored as whole cents and read back as exact Decimals.
+    """
+
+    def test_parse_amount(self):
+        self.assertEqual(str(parse_amount("12")), "12.00")
+        self.assertEqual(str(parse_amount(" 12.5 ")), "12.50")
+        self.assertEqual(str(parse_amount("0.07")), "0.07")
+        for text in (None, "", "abc", "-1", "+1", "1.999", "1e3", "1,000", ".5", "12.",
+                     "NaN", "Infinity", "1" * 14):
+            self.assertIsNone(parse_amount(text), text)
+
+    def test_to_cents(self):
+        self.assertEqual(to_cents(Decimal("12.34")), 1234)
+        self.assertEqual(to_cents(0.1 + 0.2), 30)
+        self.assertEqual(to_cents("19.99"), 1999)
+
+    def test_round_trip(self):
+        owner = User.objects.create_user("owner", "owner@example.com", "password")
+        for amount in ("0.01", "0.10", "19.99", "1234567890.99"):
+            listing = AuctionListing.objects.create(
+                user=owner, title="Listing", description="Something",
+                starting_bid=Decimal(amount), category="TOYS")
+            listing.refresh_from_db()
+            self.assertEqual(str(listing.starting_bid), amount)
+            self.assertEqual(str(listing.price), amount)
+            self.assertEqual(AuctionListing.objects.filter(price=Decimal(amount)).get(), listing)
+            listing.delete()
+        listing = AuctionListing.objects.create(
+            user=owner, title="Listing", description="Something", starting_bid=0.3,
+            category="TOYS")
+        self.assertTrue(AuctionListing.objects.filter(pk=listing.pk, price__gt=Decimal("0.29"),
+                                                      price__lt=Decimal("0.31")).exists())
+
+
+class PlaceBidTests(TestCase):
+    """
+    Bids must beat the current price by MIN_INCREMENT and only count on
+    open auctions.
+    """
+
+    def setUp(self):
+        self.owner = User.objects.create_user("owner", "owner@example.com", "password")
+        self.alice = User.objects.create_user("alice", "alice@example.com", "password")
+        self.bob = User.objects.create_user("bob", "bob@example.com", "password")
+        self.listing = AuctionListing.objects.create(
+            user=self.owner, title="Listing", description="Something",
+            starting_bid=10, category="TOYS")
+
+    def test_run_of_bids(self):
+        self.assertTrue(place_bid(self.listing.id, self.alice, Decimal("11")))
+        self.assertFalse(place_bid(self.listing.id, self.bob, Decimal("11.99")))
+        self.assertTrue(place_bid(self.listing.id, self.bob, Decimal("12.50")))
+        self.assertTrue(place_bid(self.listing.id, self.alice, Decimal("20")))
+        self.assertFalse(place_bid(self.listing.id, self.bob, Decimal("20")))
+
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.price, Decimal("20.00"))
+        self.assertEqual(self.listing.bid_count, 3)
+        self.assertEqual(self.listing.leader, self.alice)
+        self.assertEqual(list(Bid.objects.order_by("id").values_list("amount", flat=True)),
+                         [Decimal("11.00"), Decimal("12.50"), Decimal("20.00")])
+        self.assertTrue(WatchList.objects.filter(user=self.bob, listing=self.listing).exists())
+
+    def test_low_bid_refused(self):
+        # The starting bid itself is too low
+        self.assertFalse(place_bid(self.listing.id, self.alice, Decimal("10")))
+        self.assertFalse(place_bid(self.listing.id, self.alice, Decimal("10.99")))
+        self.listing.refresh_from_db()
+        self.assertEqual((self.listing.price, self.listing.bid_count, self.listing.leader),
+                         (Decimal("10.00"), 0, None))
+        self.assertFalse(Bid.objects.exists())
+
+    def test_closed_listing_refused(self):
+        AuctionListing.objects.filter(pk=self.listing.pk).update(active=False)
+        self.assertFalse(place_bid(self.listing.id, self.alice, Decimal("50")))
+        self.assertFalse(Bid.objects.exists())
+
+    def test_expired_listing_refused(self):
+        AuctionListing.objects.filter(pk=self.listing.pk).update(
+            ends_at=timezone.now() - timedelta(seconds=1))
+        self.assertFalse(place_bid(self.listing.id, self.alice, Decimal("50")))
+        AuctionListing.objects.filter(pk=self.listing.pk).update(
+            ends_at=timezone.now() + timedelta(hours=1))
+        self.assertTrue(place_bid(self.listing.id, self.alice, Decimal("50")))
+
+    def test_view_messages(self):
+        self.client.force_login(self.alice)
+        response = self.client.post(f"/bid_listing/{self.listing.id}", {"bid": "10.50"}, follow=True)
+        self.assertContains(response, "You must bid 1$ higher than the current bid.")
+        AuctionListing.objects.filter(pk=self.listing.pk).update(active=False)
+        response = self.client.post(f"/bid_listing/{self.listing.id}", {"bid": "50"}, follow=True)
+        self.assertContains(response, "This auction is closed.")
+
+
+def place_bid_retrying(listing_id, user, amount):
+    """
+    Calls place_bid until the database lets it through. The in-memory
+    SQLite test database refuses writes from other connections while one
+    is writing, instead of waiting like a database server would.
+    """
+    while True:
+        try:
+            return place_bid(listing_id, user, amount)
+        except OperationalError as e:
+            if "locked" not in str(e):
+                raise
+            time.sleep(0.001)
+
+
+class ConcurrentBidTests(TransactionTestCase):
+    """
+    Bids placed at the same time from many threads must leave the
+    listing consistent with the bids that were accepted.
+    """
+
+    def test_concurrent_bids(self):
+        owner = User.objects.create_user("owner", "owner@example.com", "password")
+        bidders = [User.objects.create_user(f"bidder{i}", f"bidder{i}@example.com", "password")
+                   for i in range(8)]
+        listing = AuctionListing.objects.create(
+            user=owner, title="Listing", description="Something",
+            starting_bid=10, category="TOYS")
+        amounts = [Decimal(11 + i) for i in range(80)]
+        random.Random(0).shuffle(amounts)
+        accepted = []
+        start = threading.Barrier(len(bidders))
+
+        errors = []
+
+        def bid(bidder, amounts):
+            start.wait()
+            try:
+                for amount in amounts:
+                    if place_bid_retrying(listing.id, bidder, amount):
+                        accepted.append((amount, bidder))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=bid, args=(bidder, amounts[i::len(bidders)]))
+                   for i, bidder in enumerate(bidders)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        listing.refresh_from_db()
+        top_amount, top_bidder = max(accepted, key=lambda item: item[0])
+        self.assertEqual(listing.bid_count, len(accepted))
+        self.assertEqual(listing.bid_count, Bid.objects.count())
+        self.assertEqual(listing.price, top_amount)
+        self.assertEqual(listing.price, max(Bid.objects.values_list("amount", flat=True)))
+        self.assertEqual(listing.leader, top_bidder)
+        # Every accepted bid beat the one accepted before it
+        history = list(Bid.objects.order_by("id").values_list("amount", flat=True))
+        self.assertTrue(all(b - a >= MIN_INCREMENT for a, b in zip(history, history[1:])))
+
+
+class CloseAuctionsTests(TestCase):
+    """
+    Closing auctions must run a fixed number of queries however many
+    auctions are selected.
+    """
+
+    def setUp(self):
+        self.owner = User.objects.create_user("owner", "owner@example.com", "password")
+        self.bidder = User.objects.create_user("bidder", "bidder@example.com", "password")
+
+    def add_listings(self, count, bids=True):
+        listings = AuctionListing.objects.bulk_create([
+            AuctionListing(user=self.owner, title=f"Listing {i}", description="Something",
+                           starting_bid=10, price=10, category="TOYS")
+            for i in range(count)])
+        if bids:
+            Bid.objects.bulk_create([Bid(auction=listing, bidder=self.bidder, amount=11)
+                                     for listing in listings])
+        WatchList.objects.bulk_create([WatchList(user=self.bidder, listing=listing)
+                                       for listing in listings])
+
+    def test_close_auctions(self):
+        for count in (1, 200):
+            self.add_listings(count)
+            with self.assertNumQueries(5):
+                close_auctions(AuctionListing.objects.filter(active=True))
+        self.assertFalse(AuctionListing.objects.filter(active=True).exists())
+        self.assertFalse(WatchList.objects.exists())
+        self.assertEqual(AuctionListing.objects.filter(winner=self.bidder).count(), 201)
+
+    def test_declare_winner_skips_auctions_without_bids(self):
+        self.add_listings(3)
+        self.add_listings(2, bids=False)
+        declare_winner(None, None, AuctionListing.objects.all())
+        self.assertEqual(AuctionListing.objects.filter(active=True).count(), 2)
+
+
+class ExpiryTests(TestCase):
+    """
+    Listings with an end time stop taking bids and are closed by the
+    worker once it has passed.
+    """
+
+    def setUp(self):
+        self.owner = User.objects.create_user("owner", "owner@example.com", "password")
+        self.bidder = User.objects.create_user("bidder", "bidder@example.com", "password")
+        self.now = timezone.now()
+
+    def add_listing(self, ends_in, active=True):
+        ends_at = None if ends_in is None else self.now + timedelta(minutes=ends_in)
+        return AuctionListing.objects.create(
+            user=self.owner, title="Listing", description="Something", starting_bid=10,
+            category="TOYS", ends_at=ends_at, active=active)
+
+    def test_close_expired_auctions(self):
+        expired = [self.add_listing(-minutes) for minutes in (1, 2, 3)]
+        open_listings = [self.add_listing(5), self.add_listing(None)]
+        Bid.objects.create(auction=expired[0], bidder=self.bidder, amount=11)
+
+        self.assertEqual(close_expired_auctions(now=self.now, batch_size=2), 3)
+        self.assertEqual(close_expired_auctions(now=self.now), 0)
+        self.assertEqual(set(AuctionListing.objects.filter(active=True)), set(open_listings))
+        self.assertEqual(AuctionListing.objects.get(pk=expired[0].pk).winner, self.bidder)
+
+    def test_next_expiry(self):
+        self.assertIsNone(next_expiry())
+        self.add_listing(None)
+        self.add_listing(-10, active=False)
+        self.assertIsNone(next_expiry())
+        self.add_listing(30)
+        first = self.add_listing(20)
+        self.assertEqual(next_expiry(), first.ends_at)
+
+    def test_reopen_expired_auction(self):
+        expired = self.add_listing(-10)
+        later = self.add_listing(10)
+        close_expired_auctions()
+        AuctionListing.objects.filter(pk=later.pk).update(active=False)
+        active_auctions(None, None, AuctionListing.objects.filter(pk__in=[expired.pk, later.pk]))
+
+        expired.refresh_from_db()
+        self.assertTrue(expired.active)
+        self.assertIsNone(expired.ends_at)
+        self.assertEqual(AuctionListing.objects.get(pk=later.pk).ends_at, later.ends_at)
+        self.assertTrue(place_bid(expired.id, self.bidder, Decimal("11")))
+        self.assertEqual(close_expired_auctions(), 0)
+
+    def test_bid_after_end_refused(self):
+        listing = self.add_listing(-1)
+        self.client.force_login(self.bidder)
+        response = self.client.post(f"/bid_listing/{listing.id}", {"bid": "50"}, follow=True)
+        self.assertContains(response, "This auction is closed.")
+        self.assertFalse(Bid.objects.exists())
+
+    def test_form_rejects_past_end(self):
+        data = {"title": "Listing", "description": "Something", "starting_bid": "10",
+                "category": "TOYS"}
+        past = timezone.localtime(self.now - timedelta(hours=1)).strftime("%Y-%m-%dT%H:%M")
+        future = timezone.localtime(self.now + timedelta(days=1)).strftime("%Y-%m-%dT%H:%M")
+        form = AuctionListingForm({**data, "ends_at": past})
+        self.assertEqual(form.errors["ends_at"], ["The auction must end in the future."])
+        self.assertTrue(AuctionListingForm({**data, "ends_at": future}).is_valid())
+        self.assertTrue(AuctionListingForm(data).is_valid())
+
+        self.client.force_login(self.owner)
+        response = self.client.post("/create", {**data, "ends_at": past})
+        self.assertContains(response, "The auction must end in the future.")
+        self.assertFalse(AuctionListing.objects.exists())
+
+
+@skipUnless(connection.vendor == "sqlite", "Checks SQLite query plans")
+class QueryPlanTests(TestCase):
+    """
+    Listing pages and bid lookups must be read in order from an index,
+    without sorting the whole table.
+    """
+
+    def setUp(self):
+        self.owner = User.objects.create_user("owner", "owner@example.com", "password")
+        self.bidder = User.objects.create_user("bidder", "bidder@example.com", "password")
+        AuctionListing.objects.bulk_create([
+            AuctionListing(user=self.owner, title=f"Listing {i}", description="Something",
+                           starting_bid=10, price=10, active=i % 10 == 0,
+                           category=("TOYS", "BOOK")[i % 2],
+                           ends_at=timezone.now() + timedelta(minutes=i - 100))
+            for i in range(500)])
+        self.listing = AuctionListing.objects.first()
+        Bid.objects.bulk_create([Bid(auction=listing, bidder=self.bidder, amount=11 + i)
+                                 for listing in AuctionListing.objects.all()[:50]
+                                 for i in range(10)])
+        # Give the planner statistics, as a real database would have
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+    def assertUsesIndex(self, queryset, table, indexes):
+        """
+        Checks `table` is read through one of `indexes` and the rows
+        come out of it in order. A partial index with nothing left to
+        search on is scanned whole.
+        """
+        plan = queryset.explain()
+        self.assertRegex(plan, rf"(SEARCH|SCAN) {table} USING (COVERING )?INDEX "
+                               rf"({'|'.join(indexes)})\b")
+        self.assertNotIn("TEMP B-TREE", plan)
+
+    def test_listing_pages(self):
+        listings = AuctionListing.objects.order_by("-id")
+        self.assertUsesIndex(listings.filter(active=True)[:51], "auctions_auctionlisting",
+                             ["listing_active_idx"])
+        self.assertUsesIndex(listings.filter(category="BOOK", active=True, id__lt=400)[:51],
+                             "auctions_auctionlisting", ["listing_category_idx"])
+
+    def test_expiry(self):
+        expired = (AuctionListing.objects.filter(active=True, ends_at__lte=timezone.now())
+                   .order_by("ends_at").values("id"))
+        self.assertUsesIndex(expired[:1000], "auctions_auctionlisting", ["listing_ends_at_idx"])
+
+    def test_bids(self):
+        self.assertUsesIndex(self.listing.bids.order_by("-amount"), "auctions_bid",
+                             ["bid_auction_amount_idx"])
+        self.assertUsesIndex(Bid.objects.filter(bidder=self.bidder).order_by("-timestamp"),
+                             "auctions_bid", ["bid_bidder_timestamp_idx"])
+
+
+class WatchListCacheTests(TestCase):
+    """
+    The cached watch list must follow every change to the WatchList rows.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user("owner", "owner@example.com", "password")
+        self.bidder = User.objects.create_user("bidder", "bidder@example.com", "password")
+        self.listing = AuctionListing.objects.create(
+            user=self.owner, title="Listing", description="Something",
+            starting_bid=10, category="TOYS")
+        self.client.force_login(self.bidder)
+
+    def test_add_and_remove(self):
+        self.assertEqual(watched_listing_ids(self.bidder), set())
+        self.client.post(f"/add_to_watchlist/{self.listing.id}")
+        self.assertEqual(watched_listing_ids(self.bidder), {self.listing.id})
+        item = WatchList.objects.get(user=self.bidder)
+        self.client.post("/watchlist", {"item_id": item.id})
+        self.assertEqual(watched_listing_ids(self.bidder), set())
+
+    def test_bid_and_close(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f"/bid_listing/{self.listing.id}", {"bid": "11"})
+        self.assertEqual(watched_listing_ids(self.bidder), {self.listing.id})
+        with self.captureOnCommitCallbacks(execute=True):
+            close_auctions(AuctionListing.objects.filter(pk=self.listing.pk))
+        self.assertEqual(watched_listing_ids(self.bidder), set())
+
+    def test_add_twice(self):
+        self.client.post(f"/add_to_watchlist/{self.listing.id}")
+        response = self.client.post(f"/add_to_watchlist/{self.listing.id}", follow=True)
+        self.assertContains(response, "Item is already in Watch List.")
+        self.assertEqual(WatchList.objects.filter(user=self.bidder).count(), 1)
+
+    def test_remove_listing(self):
+        self.client.post(f"/add_to_watchlist/{self.listing.id}")
+        self.assertEqual(watched_listing_ids(self.bidder), {self.listing.id})
+        self.client.force_login(self.owner)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f"/remove_listing/{self.listing.id}")
+        self.assertEqual(watched_listing_ids(self.bidder), set())
+
+
+class SearchTests(TestCase):
+    """
+    The search index must follow the listings it covers.
+    """
+
+    def setUp(self):
+        self.owner = User.objects.create_user("owner", "owner@example.com", "password")
+        self.lamp = AuctionListing.objects.create(
+            user=self.owner, title="Brass lamp", description="An old desk lamp",
+            starting_bid=30, category="TOYS")
+        self.book = AuctionListing.objects.create(
+            user=self.owner, title="Lamp repair book", description="How to fix things",
+            starting_bid=5, category="BOOK")
+        self.toy = AuctionListing.objects.create(
+            user=self.owner, title="Robot", description="Has a lamp on its head",
+            starting_bid=12, category="TOYS")
+
+    def assertResults(self, expected, *args, **kwargs):
+        self.assertEqual(search_listings(*args, **kwargs), expected)
+        # The fallback must agree with the index on what matches
+        self.assertEqual(set(_search_like(search_terms(args[0]), kwargs.get("category"),
+                                          kwargs.get("min_price"), kwargs.get("max_price"),
+                                          20, 0)), set(expected))
+
+    def test_ranking_and_filters(self):
+        results = search_listings("lamp")
+        self.assertEqual(set(results[:2]), {self.lamp, self.book})
+        self.assertEqual(results[2], self.toy)
+        self.assertResults([self.lamp], "brass lamp")
+        self.assertResults([self.book], "lamp", category="BOOK")
+        self.assertResults([self.lamp, self.toy], "lamp", min_price=10)
+        self.assertResults([self.book], "lamp", max_price=10)
+        self.assertResults([], "AND OR")
+
+    def test_index_follows_changes(self):
+        self.toy.title = "Lamp robot"
+        self.toy.save()
+        self.assertEqual(search_listings("robot lamp"), [self.toy])
+        self.book.delete()
+        self.assertEqual(search_listings("repair"), [])
+        AuctionListing.objects.filter(pk=self.lamp.pk).update(active=False)
+        self.assertNotIn(self.lamp, search_listings("lamp"))
+
+    def test_view_pages(self):
+        response = self.client.get("/search/", {"q": "lamp", "limit": 2})
+        self.assertEqual(len(response.context["results"]), 2)
+        response = self.client.get("/search/?" + response.context["next_page"])
+        self.assertEqual(response.context["results"], [self.toy])
+        self.assertIsNone(response.context["next_page"])
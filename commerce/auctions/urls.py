@@ -18,5 +18,6 @@ urlpatterns = [
     path("bid_listing/<int:id>", views.bid_listing, name="bid_listing"),
     path("categories/", views.categories, name="categories"),
     path("categories/<str:category_name>/", views.category_detail, name="category_detail"),
-    path("closed_listings/", views.closed_listings, name="closed_listings")
+    path("closed_listings/", views.closed_listings, name="closed_listings"),
+    path("search/", views.search, name="search")
 ]
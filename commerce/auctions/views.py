@@ -1,21 +1,61 @@
 from django.contrib import messages
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
-from django.db import IntegrityError
-from django.http import HttpResponse, HttpResponseRedirect
+from django.db import IntegrityError, transaction
+from django.http import Http404, HttpResponse, HttpResponseRedirect
 from django.shortcuts import render, get_object_or_404, redirect
 from django.urls import reverse
+from django.utils.http import urlencode
+from django.utils import timezone
 
 
+from .bidding import place_bid
+from .closing import close_auctions
+from .fields import parse_amount
 from .models import AuctionListing, Bid, Comment, User, WatchList
+from .search import search_listings
+from .watching import forget_watchlists, watched_listing_ids
 from .forms import AuctionListingForm
 
+# Number of listings per page, unless ?limit= asks for fewer or more
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+# Ranked search results are paged by number, so deep pages cost more
+MAX_SEARCH_PAGE = 50
+
+
+def page_limit(request):
+    try:
+        return max(1, min(int(request.GET.get('limit', PAGE_SIZE)), MAX_PAGE_SIZE))
+    except ValueError:
+        return PAGE_SIZE
+
+
+def paginate(request, listings):
+    """
+    Returns one page of listings, newest first, and the cursor of the
+    next page (None on the last page). Pages are selected with
+    ?before=<id> instead of an offset, so every page costs the same.
+    """
+    limit = page_limit(request)
+    before = request.GET.get('before', '')
+    if before.isdigit():
+        listings = listings.filter(id__lt=int(before))
+
+    # Fetch one more row to know if there is a next page
+    page = list(listings.order_by('-id')[:limit + 1])
+    next_cursor = page[limit - 1].id if len(page) > limit else None
+    return page[:limit], {'next_cursor': next_cursor, 'limit': limit}
+
+
 def index(request):
     """
     Show a list of all my biddings
     """
     if request.user.is_authenticated:
-        user_bids = Bid.objects.filter(bidder=request.user).order_by('-timestamp')
+        user_bids = (Bid.objects.filter(bidder=request.user)
+                     .select_related('auction').order_by('-timestamp'))
     else:
         user_bids = []
     return render(request, "auctions/index.html", {
@@ -81,18 +121,19 @@ def active_listings(request):
     Show a list of active listings
     """
     # Get auction by id
-    active_listing = AuctionListing.objects.filter(active=True)
+    active_listing, pagination = paginate(request, AuctionListing.objects.filter(active=True))
 
     if request.user.is_authenticated:
-        user_bids = Bid.objects.filter(bidder_id=request.user).values_list('auction', flat=True)
+        user_bids = set(Bid.objects.filter(bidder_id=request.user).values_list('auction', flat=True))
     else:
-        user_bids = []
+        user_bids = set()
 
     # Pass the auction listing to the template
     return render(request, "auctions/active_listings.html", {
         "active_listing": active_listing,
         "user": request.user,
-        "user_bids": user_bids
+        "user_bids": user_bids,
+        **pagination
     })
 
 
@@ -101,10 +142,11 @@ def closed_listings(request):
     """
     Show a list of closed listings
     """
-    closed_listings = AuctionListing.objects.filter(active=False)
+    closed_listings, pagination = paginate(request, AuctionListing.objects.filter(active=False))
     
     return render(request, "auctions/closed_listings.html", {
-        "closed_listing": closed_listings
+        "closed_listing": closed_listings,
+        **pagination
     })
 
 
@@ -112,10 +154,11 @@ def listing(request, id):
     """
     A unique page for each listing
     """
-    form = AuctionListing.objects.get(pk=id)
-    comments = Comment.objects.filter()
-    bids = Bid.objects.filter(auction=form).order_by('-amount')
+    form = get_object_or_404(AuctionListing.objects.select_related('user', 'winner'), pk=id)
+    comments = form.comments.select_related('user')
+    bids = form.bids.select_related('bidder', 'auction').order_by('-amount')
     winner = form.winner
+    watching = request.user.is_authenticated and form.id in watched_listing_ids(request.user)
 
     return render(request, "auctions/listing.html", {
         "form": form,
@@ -123,6 +166,7 @@ def listing(request, id):
         "comments": comments,
         "bids": bids,
         "winner": winner,
+        "watching": watching,
     })
 
 
@@ -145,9 +189,11 @@ def create(request):
     # GET
     else:
         form = AuctionListingForm()
-        return render(request, "auctions/create.html", {
-            "form": form,
-        })
+
+    # Show the form again with its errors if it was not valid
+    return render(request, "auctions/create.html", {
+        "form": form,
+    })
     
 
 @login_required
@@ -174,13 +220,18 @@ def add_to_watchlist(request, id):
     Add an item to the watch list.
     """
     listing = get_object_or_404(AuctionListing, pk=id)
-    if not WatchList.objects.filter(user=request.user, listing=listing).exists():
-        WatchList.objects.create(user=request.user, listing=listing)
-        return redirect('listing', id=id)
     # Cannot add the same item to the watch list twice
-    else:
+    if listing.id in watched_listing_ids(request.user):
         messages.error(request, "Item is already in Watch List.")
-        return redirect('listing', id=id)
+    else:
+        try:
+            with transaction.atomic():
+                WatchList.objects.create(user=request.user, listing=listing)
+        except IntegrityError:
+            # Added by another request since the cached list was read
+            messages.error(request, "Item is already in Watch List.")
+        forget_watchlists([request.user.pk])
+    return redirect('listing', id=id)
         
 
 @login_required
@@ -191,15 +242,13 @@ def watchlist(request):
     if request.method == 'POST':
         item_id = request.POST.get('item_id')
         WatchList.objects.filter(pk=item_id, user=request.user).delete()
+        forget_watchlists([request.user.pk])
 
-        # Fetch updated list
-        watchlist = WatchList.objects.filter(user=request.user)
-        return render(request, "auctions/watch_list.html", {
-            "watchlist": watchlist,
-        })
+        # Show the updated list
+        return redirect('watchlist')
 
     else:
-        watchlist = WatchList.objects.filter(user=request.user)
+        watchlist = WatchList.objects.filter(user=request.user).select_related('listing')
         return render(request, "auctions/watch_list.html", {
             "watchlist": watchlist,
         })
@@ -212,7 +261,11 @@ def remove_listing(request, id):
     """
     if request.method == "POST":
         listing = get_object_or_404(AuctionListing, pk=id)
-        listing.delete()
+        with transaction.atomic():
+            # The watch list rows go with the listing, so find them first
+            watchers = set(listing.watchlist_set.values_list('user_id', flat=True))
+            listing.delete()
+            transaction.on_commit(lambda: forget_watchlists(watchers))
         return redirect('active_listings')
     
 
@@ -223,13 +276,8 @@ def close_listing(request, id):
     """
     if request.method == "POST":
         listing = get_object_or_404(AuctionListing, pk=id)
-        listing.active = False
-        highest_bid = Bid.objects.filter(auction=listing).order_by('-amount').first()
-        listing.winner = highest_bid.bidder
-        listing.save()
-
-        # Remove the listing from all watch lists
-        WatchList.objects.filter(listing=listing).delete()
+        # The highest bidder wins, if anyone bid at all
+        close_auctions(AuctionListing.objects.filter(pk=listing.pk))
 
         return redirect('listing', id=id)
     
@@ -239,28 +287,20 @@ def bid_listing(request, id):
     """
     Bid higher
     """
-    try:
-        bid = float(request.POST.get('bid'))
-    
-    except ValueError:
-        messages.error(request, "Enter a Number.")
+    bid = parse_amount(request.POST.get('bid'))
+    if bid is None:
+        messages.error(request, "Enter an amount like 12 or 12.50.")
         return redirect('listing', id=id)
     
-    listing = get_object_or_404(AuctionListing, pk=id)
-
-    if (bid >= listing.starting_bid + 1):
-        listing.starting_bid = bid
-        listing.save()
-
-        # Create a new Bid instance
-        Bid.objects.create(auction=listing, bidder=request.user, amount=bid)
-
-        if not WatchList.objects.filter(user=request.user, listing=listing).exists():
-            WatchList.objects.create(user=request.user, listing=listing)
-
+    if place_bid(id, request.user, bid):
         return redirect('listing', id=id)
     else:
-        messages.error(request, "You must bid 1$ higher than the current bid.")
+        # Only look the listing up when the bid was refused
+        listing = get_object_or_404(AuctionListing, pk=id)
+        if not listing.active or (listing.ends_at and listing.ends_at <= timezone.now()):
+            messages.error(request, "This auction is closed.")
+        else:
+            messages.error(request, "You must bid 1$ higher than the current bid.")
         return redirect('listing', id=id)
     
 
@@ -273,8 +313,48 @@ def categories(request):
 
 
 def category_detail(request, category_name):
-    active_listing = AuctionListing.objects.filter()
+    categories = dict(AuctionListing.CATEGORY_CHOICES)
+    if category_name not in categories:
+        raise Http404("No such category.")
+    active_listing, pagination = paginate(request, AuctionListing.objects.filter(
+        category=category_name, active=True))
     return render(request, 'auctions/category_detail.html', {
         'active': active_listing,
-        'category_name': category_name
+        'category_name': category_name,
+        'category_label': categories[category_name],
+        **pagination
+    })
+
+
+def search(request):
+    """
+    Search the active listings by title and description, optionally
+    within a category and a price range.
+    """
+    query = request.GET.get('q', '').strip()
+    category = request.GET.get('category', '')
+    if category not in dict(AuctionListing.CATEGORY_CHOICES):
+        category = ''
+    min_price = parse_amount(request.GET.get('min_price'))
+    max_price = parse_amount(request.GET.get('max_price'))
+    limit = page_limit(request)
+    page = request.GET.get('page', '1')
+    page = min(int(page), MAX_SEARCH_PAGE) if page.isdigit() and int(page) > 0 else 1
+
+    # Fetch one more row to know if there is a next page
+    results = search_listings(query, category=category, min_price=min_price,
+                              max_price=max_price, limit=limit + 1,
+                              offset=(page - 1) * limit)
+    next_page = None
+    if len(results) > limit and page < MAX_SEARCH_PAGE:
+        next_page = urlencode({**request.GET.dict(), 'page': page + 1})
+
+    return render(request, 'auctions/search.html', {
+        'results': results[:limit],
+        'query': query,
+        'category': category,
+        'categories': AuctionListing.CATEGORY_CHOICES,
+        'min_price': min_price,
+        'max_price': max_price,
+        'next_page': next_page,
     })
@@ -0,0 +1,27 @@
+from django.core.cache import cache
+
+from .models import WatchList
+
+
+def _key(user_id):
+    return f"auctions:watchlist:{user_id}"
+
+
+def watched_listing_ids(user):
+    """
+    Returns the set of ids of the listings on a user's watch list,
+    querying the database only when the cache does not have it.
+    """
+    ids = cache.get(_key(user.pk))
+    if ids is None:
+        ids = set(WatchList.objects.filter(user=user).values_list('listing_id', flat=True))
+        cache.set(_key(user.pk), ids)
+    return ids
+
+
+def forget_watchlists(user_ids):
+    """
+    Drops the cached watch lists of the given users. Call it after
+    every change to their WatchList rows.
+    """
+    cache.delete_many([_key(user_id) for user_id in user_ids])
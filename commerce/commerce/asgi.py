@@ -13,4 +13,10 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'commerce.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported once Django is set up
+from auctions.events import with_listing_events  # noqa: E402
+
+# Live bid updates on listing pages, see auctions/events.py
+application = with_listing_events(django_application)
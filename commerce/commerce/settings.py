@@ -31,7 +31,7 @@ ALLOWED_HOSTS = []
 # Application definition
 
 INSTALLED_APPS = [
-    'auctions',
+    'auctions.apps.AuctionsConfig',
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -63,6 +63,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'auctions.context_processors.watchlist',
             ],
         },
     },
@@ -120,3 +121,14 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/3.0/howto/static-files/
 
 STATIC_URL = '/static/'
+
+
+# Pub/sub used to push new bids to open listing pages. LocalBroker only
+# reaches clients connected to the same process.
+
+AUCTIONS_BROKER = 'auctions.events.LocalBroker'
+
+
+# Watch lists are cached per user (see auctions/watching.py). With more
+# than one server process, CACHES must point at a shared cache such as
+# Memcached or Redis so every process sees the invalidations.
@@ -0,0 +1,35 @@
+from django.db import transaction
+
+from .models import Email, MailboxEntry, User
+
+
+def resolve_recipients(addresses):
+    """
+    Returns the users with the given email addresses, in the order the
+    addresses were given, and the list of addresses nobody has.
+    """
+    users = {}
+    for user in User.objects.filter(email__in=set(addresses)):
+        users.setdefault(user.email, user)
+    recipients = list({users[address].pk: users[address]
+                       for address in addresses if address in users}.values())
+    unknown = list(dict.fromkeys(address for address in addresses if address not in users))
+    return recipients, unknown
+
+
+def send_email(sender, recipients, subject, body):
+    """
+    Stores an email once, with an entry in the sender's sent folder and
+    in every recipient's inbox, using a fixed number of queries.
+    """
+    Recipient = Email.recipients.through
+    with transaction.atomic():
+        email = Email.objects.create(sender=sender, subject=subject, body=body)
+        Recipient.objects.bulk_create([Recipient(email=email, user=user) for user in recipients])
+        entries = [MailboxEntry(user=sender, email=email, folder=MailboxEntry.SENT,
+                                read=True, timestamp=email.timestamp)]
+        entries += [MailboxEntry(user=user, email=email, folder=MailboxEntry.INBOX,
+                                 read=user == sender, timestamp=email.timestamp)
+                    for user in recipients]
+        MailboxEntry.objects.bulk_create(entries)
+    return email
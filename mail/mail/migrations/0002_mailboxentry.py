@@ -0,0 +1,149 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:26
+
+from itertools import islice
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+# Rows read, written or deleted per query while moving the data
+BATCH_SIZE = 2000
+
+# Copies of one message were saved one after another by the old compose
+# view, so their timestamps are at most this many seconds apart
+COPY_WINDOW = 60
+
+
+def batches(iterable):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, BATCH_SIZE))
+        if not batch:
+            return
+        yield batch
+
+
+def split_copies(apps, schema_editor):
+    """
+    Old rows hold one copy of a message per user. Keep the first copy of
+    every message as its only Email row, give each user a MailboxEntry
+    with the flags of their copy, then delete the other copies.
+    """
+    Email = apps.get_model('mail', 'Email')
+    MailboxEntry = apps.get_model('mail', 'MailboxEntry')
+    Recipient = Email.recipients.through
+
+    rows = (Email.objects.order_by('id')
+            .values_list('id', 'user_id', 'sender_id', 'subject', 'body',
+                         'timestamp', 'read', 'archived')
+            .iterator(chunk_size=BATCH_SIZE))
+    duplicates = []
+    key = first = None
+    # Users with a copy in the current group. Each send made exactly one
+    # copy per user, so a user seen again means the same message was
+    # sent again.
+    seen = set()
+    for batch in batches(rows):
+        recipients = {}
+        for email_id, user_id in Recipient.objects.filter(
+                email_id__in=[row[0] for row in batch]).values_list('email_id', 'user_id'):
+            recipients.setdefault(email_id, set()).add(user_id)
+
+        entries = []
+        for id, user_id, sender_id, subject, body, timestamp, read, archived in batch:
+            to = frozenset(recipients.get(id, ()))
+            if (key == (sender_id, subject, body, to)
+                    and (timestamp - first[1]).total_seconds() <= COPY_WINDOW
+                    and user_id not in seen):
+                duplicates.append(id)
+            else:
+                key = (sender_id, subject, body, to)
+                first = (id, timestamp)
+                seen = set()
+            seen.add(user_id)
+            folders = []
+            if user_id == sender_id:
+                folders.append('sent')
+            if user_id in to or not folders:
+                folders.append('inbox')
+            entries += [MailboxEntry(user_id=user_id, email_id=first[0], folder=folder,
+                                     read=read, archived=archived, timestamp=first[1])
+                        for folder in folders]
+        MailboxEntry.objects.bulk_create(entries, ignore_conflicts=True)
+
+    for ids in batches(duplicates):
+        Recipient.objects.filter(email_id__in=ids).delete()
+        Email.objects.filter(id__in=ids).delete()
+
+
+def join_copies(apps, schema_editor):
+    """
+    Turns every user's MailboxEntry back into their own copy of the
+    message.
+    """
+    Email = apps.get_model('mail', 'Email')
+    MailboxEntry = apps.get_model('mail', 'MailboxEntry')
+
+    entries = (MailboxEntry.objects.order_by('email_id', 'user_id', 'folder')
+               .select_related('email').iterator(chunk_size=BATCH_SIZE))
+    last_email = last_user = None
+    for entry in entries:
+        if (entry.email_id, entry.user_id) == (last_email, last_user):
+            # The sent entry of someone who emailed themselves
+            continue
+        if entry.email_id != last_email:
+            Email.objects.filter(id=entry.email_id).update(
+                user_id=entry.user_id, read=entry.read, archived=entry.archived)
+        else:
+            message = entry.email
+            copy = Email.objects.create(user_id=entry.user_id, sender_id=message.sender_id,
+                                        subject=message.subject, body=message.body,
+                                        read=entry.read, archived=entry.archived)
+            Email.objects.filter(id=copy.id).update(timestamp=message.timestamp)
+            copy.recipients.set(message.recipients.all())
+        last_email, last_user = entry.email_id, entry.user_id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mail', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MailboxEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('folder', models.CharField(choices=[('inbox', 'Inbox'), ('sent', 'Sent')], max_length=5)),
+                ('read', models.BooleanField(default=False)),
+                ('archived', models.BooleanField(default=False)),
+                ('timestamp', models.DateTimeField()),
+                ('email', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='entries', to='mail.email')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='mailbox', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'email', 'folder'), name='unique_mailbox_entry')],
+            },
+        ),
+        # Nullable for now so the migration can be reversed
+        migrations.AlterField(
+            model_name='email',
+            name='user',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='emails', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(split_copies, join_copies),
+        migrations.RemoveField(
+            model_name='email',
+            name='archived',
+        ),
+        migrations.RemoveField(
+            model_name='email',
+            name='read',
+        ),
+        migrations.RemoveField(
+            model_name='email',
+            name='user',
+        ),
+    ]
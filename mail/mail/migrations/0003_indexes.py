@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mail', '0002_mailboxentry'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='mailboxentry',
+            index=models.Index(fields=['user', 'folder', 'archived', '-timestamp', '-id'], name='mailbox_archived_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mailboxentry',
+            index=models.Index(fields=['user', 'folder', '-timestamp', '-id'], name='mailbox_folder_idx'),
+        ),
+        # The recipients table is created by the ManyToManyField, so its
+        # index on (user, email) for "emails received by" is added by hand
+        migrations.RunSQL(
+            'CREATE INDEX mail_recipient_user_idx ON mail_email_recipients (user_id, email_id)',
+            'DROP INDEX mail_recipient_user_idx',
+        ),
+    ]
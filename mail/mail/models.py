@@ -7,22 +7,58 @@ class User(AbstractUser):
 
 
 class Email(models.Model):
-    user = models.ForeignKey("User", on_delete=models.CASCADE, related_name="emails")
+    """
+    A message, stored once however many people it was sent to. Each
+    user's copy is a MailboxEntry.
+    """
     sender = models.ForeignKey("User", on_delete=models.PROTECT, related_name="emails_sent")
     recipients = models.ManyToManyField("User", related_name="emails_received")
     subject = models.CharField(max_length=255)
     body = models.TextField(blank=True)
     timestamp = models.DateTimeField(auto_now_add=True)
+
+
+class MailboxEntry(models.Model):
+    """
+    An email in one user's mailbox, with that user's read and archived
+    flags. Someone who emails themselves has one entry in each folder.
+    """
+    INBOX = "inbox"
+    SENT = "sent"
+    FOLDER_CHOICES = [
+        (INBOX, "Inbox"),
+        (SENT, "Sent"),
+    ]
+
+    user = models.ForeignKey("User", on_delete=models.CASCADE, related_name="mailbox")
+    email = models.ForeignKey("Email", on_delete=models.CASCADE, related_name="entries")
+    folder = models.CharField(max_length=5, choices=FOLDER_CHOICES)
     read = models.BooleanField(default=False)
     archived = models.BooleanField(default=False)
+    # Copied from the email so mailboxes are sorted without a join
+    timestamp = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "email", "folder"],
+                                    name="unique_mailbox_entry"),
+        ]
+        indexes = [
+            # Inbox and archive pages, newest first
+            models.Index(fields=["user", "folder", "archived", "-timestamp", "-id"],
+                         name="mailbox_archived_idx"),
+            # Sent pages, which do not filter on archived
+            models.Index(fields=["user", "folder", "-timestamp", "-id"],
+                         name="mailbox_folder_idx"),
+        ]
 
     def serialize(self):
         return {
-            "id": self.id,
-            "sender": self.sender.email,
-            "recipients": [user.email for user in self.recipients.all()],
-            "subject": self.subject,
-            "body": self.body,
+            "id": self.email_id,
+            "sender": self.email.sender.email,
+            "recipients": [user.email for user in self.email.recipients.all()],
+            "subject": self.email.subject,
+            "body": self.email.body,
             "timestamp": self.timestamp.strftime("%b %d %Y, %I:%M %p"),
             "read": self.read,
             "archived": self.archived
@@ -0,0 +1,52 @@
+import json
+
+from django.db.models import F
+
+
+TIMESTAMP_FORMAT = "%b %d %Y, %I:%M %p"
+
+
+def summary_rows(entries):
+    """
+    Returns a values() queryset with the fields shown in a mailbox
+    listing, loaded in one query without building model instances.
+    """
+    return entries.values("id", "email_id", "timestamp", "read", "archived",
+                          subject=F("email__subject"), sender=F("email__sender__email"))
+
+
+def timestamp_formatter():
+    """
+    Returns a function formatting timestamps like Email.serialize does.
+    Emails sent in the same minute share a string, so each minute is
+    formatted only once.
+    """
+    formatted = {}
+
+    def format_timestamp(timestamp):
+        minute = timestamp.replace(second=0, microsecond=0)
+        text = formatted.get(minute)
+        if text is None:
+            text = formatted[minute] = minute.strftime(TIMESTAMP_FORMAT)
+        return text
+    return format_timestamp
+
+
+def stream_mailbox(rows, next_cursor):
+    """
+    Yields the JSON of a mailbox page, {"emails": [...], "next": cursor},
+    one email at a time, given rows from summary_rows().
+    """
+    format_timestamp = timestamp_formatter()
+    encode = json.JSONEncoder().encode
+    yield '{"emails": ['
+    for number, row in enumerate(rows):
+        yield ("," if number else "") + encode({
+            "id": row["email_id"],
+            "sender": row["sender"],
+            "subject": row["subject"],
+            "timestamp": format_timestamp(row["timestamp"]),
+            "read": row["read"],
+            "archived": row["archived"]
+        })
+    yield f'], "next": {encode(next_cursor)}}}'
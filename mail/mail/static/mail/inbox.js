@@ -45,69 +45,115 @@ function load_mailbox(mailbox) {
   // Show the mailbox name
   document.querySelector('#emails-view').innerHTML = `<h3>${mailbox.charAt(0).toUpperCase() + mailbox.slice(1)}</h3>`;
 
-  fetch(`/emails/${mailbox}`)
+  // Load the first page, then more pages while scrolling. Pages still
+  // being fetched for the previous listing are ignored.
+  generation++;
+  current_mailbox = mailbox;
+  next_cursor = null;
+  loading = false;
+  load_page(mailbox);
+}
+
+
+// Mailbox being shown, the cursor of its next page, whether a page is
+// being fetched, and a counter bumped every time a mailbox is (re)opened
+let current_mailbox = null;
+let next_cursor = null;
+let loading = false;
+let generation = 0;
+
+window.addEventListener('scroll', () => {
+  const emailView = document.querySelector('#emails-view');
+  if (next_cursor && !loading && emailView.style.display !== 'none'
+      && window.innerHeight + window.scrollY >= document.body.offsetHeight - 200) {
+    load_page(current_mailbox, next_cursor);
+  }
+});
+
+function load_page(mailbox, before) {
+  const page_generation = generation;
+  loading = true;
+  const url = before ? `/emails/${mailbox}?before=${before}` : `/emails/${mailbox}`;
+  fetch(url)
   .then(response => response.json())
-  .then(emails => {
-    emails.forEach(email => {
-      
-      const emailView = document.querySelector('#emails-view');
-      
-      // Create email element
-      let emailElement = document.createElement('div');
-      emailElement.id = email.id;
-
-      // Create spans
-      let senderDiv = document.createElement('div');
-      let subjectDiv = document.createElement('div');
-      let timestampDiv = document.createElement('div');
-
-      // Add class
-      emailElement.className = 'email-div';
-      senderDiv.className = 'sender';
-      subjectDiv.className = 'subject';
-      timestampDiv.className = 'timestamp';
-
-      // Background
-      if (email.read) {
-        emailElement.style.background = 'lightgray';
-      }
-      else {
-        emailElement.style.background = 'white';
-      }
-      // Text
-      senderDiv.textContent = email.sender;
-      subjectDiv.textContent = email.subject;
-      timestampDiv.textContent = email.timestamp;
-
-      // Add event listener
-      emailElement.addEventListener('click', open_email)
-
-      // Append Div
-      emailElement.append(senderDiv, subjectDiv, timestampDiv);
-      // If we're in inbox page
-      if (mailbox === 'inbox') {
-        // Create a button
-        let btn = document.createElement('button');
-        btn.textContent = 'Archive';
-        btn.style.border = '1px solid black'
-        btn.style.borderRadius = '5px'
-        btn.addEventListener('click', () => archive_mail(email.id, true))
-        emailElement.append(btn);
-      }
-      else if (mailbox === 'archive') {
-        // Create a button
-        let btn = document.createElement('button');
-        btn.textContent = 'Unarchive';
-        btn.style.border = '1px solid black'
-        btn.style.borderRadius = '5px'
-        btn.addEventListener('click', () => archive_mail(email.id, false))
-        emailElement.append(btn);
-      }
-      emailView.append(emailElement);
-    })
+  .then(page => {
+    // Ignore pages of a listing the user has left or reloaded
+    if (page_generation !== generation) {
+      return;
+    }
+    page.emails.forEach(email => render_email(email, mailbox));
+    next_cursor = page.next;
+  })
+  .finally(() => {
+    if (page_generation !== generation) {
+      return;
+    }
+    loading = false;
+    // Keep loading while the page is too short to scroll
+    if (next_cursor && document.body.offsetHeight <= window.innerHeight) {
+      load_page(mailbox, next_cursor);
+    }
   })
 }
 
+function render_email(email, mailbox) {
+
+  const emailView = document.querySelector('#emails-view');
+
+  // Create email element
+  let emailElement = document.createElement('div');
+  emailElement.id = email.id;
+
+  // Create spans
+  let senderDiv = document.createElement('div');
+  let subjectDiv = document.createElement('div');
+  let timestampDiv = document.createElement('div');
+
+  // Add class
+  emailElement.className = 'email-div';
+  senderDiv.className = 'sender';
+  subjectDiv.className = 'subject';
+  timestampDiv.className = 'timestamp';
+
+  // Background
+  if (email.read) {
+    emailElement.style.background = 'lightgray';
+  }
+  else {
+    emailElement.style.background = 'white';
+  }
+  // Text
+  senderDiv.textContent = email.sender;
+  subjectDiv.textContent = email.subject;
+  timestampDiv.textContent = email.timestamp;
+
+  // Add event listener
+  emailElement.addEventListener('click', open_email)
+
+  // Append Div
+  emailElement.append(senderDiv, subjectDiv, timestampDiv);
+  // If we're in inbox page
+  if (mailbox === 'inbox') {
+    // Create a button
+    let btn = document.createElement('button');
+    btn.textContent = 'Archive';
+    btn.style.border = '1px solid black'
+    btn.style.borderRadius = '5px'
+    btn.addEventListener('click', () => archive_mail(email.id, true))
+    emailElement.append(btn);
+  }
+  else if (mailbox === 'archive') {
+    // Create a button
+    let btn = document.createElement('button');
+    btn.textContent = 'Unarchive';
+    btn.style.border = '1px solid black'
+    btn.style.borderRadius = '5px'
+    btn.addEventListener('click', () => archive_mail(email.id, false))
+    emailElement.append(btn);
+  }
+  emailView.append(emailElement);
+}
+
 
 function send_mail(event) {
   // Get the values of the form
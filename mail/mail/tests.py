@@ -1,3 +1,180 @@
-from django.test import TestCase
+import json
+from unittest import skipUnless
 
-# Create your tests here.
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase
+
+from .compose import send_email
+from .models import Email, MailboxEntry, User
+from .serializers import summary_rows
+
+
+class ComposeTests(TestCase):
+    """
+    Sending an email must take the same number of queries whatever the
+    number of recipients.
+    """
+
+    def setUp(self):
+        User.objects.bulk_create([User(username=f"user{i}@example.com", email=f"user{i}@example.com")
+                                  for i in range(101)])
+        self.sender = User.objects.get(email="user0@example.com")
+        self.client.force_login(self.sender)
+
+    def compose(self, recipients):
+        return self.client.post("/emails", json.dumps({
+            "recipients": ", ".join(recipients),
+            "subject": "Hello",
+            "body": "Hi all",
+        }), content_type="application/json")
+
+    def test_constant_queries(self):
+        # 100 recipients still fit in one INSERT on SQLite
+        for count in (1, 100):
+            recipients = [f"user{i}@example.com" for i in range(1, count + 1)]
+            # Session, user, recipients, savepoint, email, recipients,
+            # entries and release
+            with self.assertNumQueries(8):
+                response = self.compose(recipients)
+            self.assertEqual(response.status_code, 201)
+        email = Email.objects.latest("id")
+        self.assertEqual(email.recipients.count(), 100)
+        self.assertEqual(email.entries.filter(folder=MailboxEntry.INBOX).count(), 100)
+
+    def test_unknown_addresses(self):
+        response = self.compose(["user1@example.com", "nobody@example.com", "nobody2@example.com"])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["unknown"], ["nobody@example.com", "nobody2@example.com"])
+        self.assertFalse(Email.objects.exists())
+
+    def test_send_to_self(self):
+        self.compose(["user0@example.com", "user1@example.com", "user0@example.com"])
+        folders = MailboxEntry.objects.filter(user=self.sender).values_list("folder", "read")
+        self.assertEqual(sorted(folders), [("inbox", True), ("sent", True)])
+
+
+class MailboxTests(TestCase):
+    """
+    Mailboxes are returned a page at a time, newest first.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create(username="me@example.com", email="me@example.com")
+        self.other = User.objects.create(username="you@example.com", email="you@example.com")
+        self.client.force_login(self.user)
+
+    def get_page(self, mailbox, **params):
+        response = self.client.get(f"/emails/{mailbox}", params)
+        return json.loads(b"".join(response.streaming_content))
+
+    def test_constant_queries(self):
+        for count in (1, 50):
+            for i in range(count):
+                send_email(self.other, [self.user, self.other], f"Email {i}", "Body")
+            for mailbox in ("inbox", "sent", "archive"):
+                # Session, user and the page
+                with self.assertNumQueries(3):
+                    self.get_page(mailbox)
+
+    def test_pages(self):
+        for i in range(5):
+            send_email(self.other, [self.user], f"Email {i}", "Body")
+        # Emails sent at the same moment are ordered by id
+        MailboxEntry.objects.update(timestamp=MailboxEntry.objects.first().timestamp)
+
+        subjects, cursor = [], None
+        while True:
+            page = self.get_page("inbox", limit=2, **({"before": cursor} if cursor else {}))
+            self.assertTrue(all("body" not in email for email in page["emails"]))
+            subjects += [email["subject"] for email in page["emails"]]
+            cursor = page["next"]
+            if cursor is None:
+                break
+        self.assertEqual(subjects, [f"Email {i}" for i in reversed(range(5))])
+
+    def test_bad_cursor(self):
+        send_email(self.other, [self.user], "Email", "Body")
+        page = self.get_page("inbox", before="x-1", limit="many")
+        self.assertEqual(len(page["emails"]), 1)
+
+
+@skipUnless(connection.vendor == "sqlite", "Checks SQLite query plans")
+class QueryPlanTests(TestCase):
+    """
+    Mailbox pages must be read in order from an index, without sorting
+    the user's whole mailbox.
+    """
+
+    def setUp(self):
+        users = User.objects.bulk_create([User(username=f"user{i}@example.com", email=f"user{i}@example.com")
+                                          for i in range(10)])
+        self.user, self.other = users[:2]
+        for i in range(100):
+            send_email(users[i % 10], [users[(i + 1) % 10], users[(i + 3) % 10]], f"Email {i}", "Body")
+        MailboxEntry.objects.filter(id__lt=50).update(archived=True)
+        # Give the planner statistics, as a real database would have
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+    def assertUsesIndex(self, queryset, table, indexes):
+        """
+        Checks `table` is searched with one of `indexes` and the rows
+        come out of it in order.
+        """
+        plan = queryset.explain()
+        self.assertRegex(plan, rf"SEARCH {table} USING (COVERING )?INDEX ({'|'.join(indexes)})\b")
+        self.assertNotIn("TEMP B-TREE", plan)
+
+    def test_mailboxes(self):
+        listing = ["mailbox_archived_idx", "mailbox_folder_idx"]
+        entries = MailboxEntry.objects.order_by("-timestamp", "-id")
+        for archived in (False, True):
+            inbox = entries.filter(user=self.user, folder=MailboxEntry.INBOX, archived=archived)
+            self.assertUsesIndex(summary_rows(inbox)[:50], "mail_mailboxentry", listing)
+        sent = entries.filter(user=self.user, folder=MailboxEntry.SENT)
+        self.assertUsesIndex(summary_rows(sent)[:50], "mail_mailboxentry", ["mailbox_folder_idx"])
+
+    def test_recipients(self):
+        self.assertUsesIndex(Email.objects.filter(recipients=self.user).values("id"),
+                             "mail_email_recipients", ["mail_recipient_user_idx"])
+
+
+class SplitCopiesTests(TransactionTestCase):
+    """
+    Migration 0002 must turn the per-user copies of every send into one
+    Email, and keep sends of the same message apart.
+    """
+
+    def migrate(self, target):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate([("mail", target)])
+        return executor.loader.project_state([("mail", target)]).apps
+
+    def tearDown(self):
+        self.migrate("0003_indexes")
+
+    def test_repeated_sends(self):
+        apps = self.migrate("0001_initial")
+        OldUser = apps.get_model("mail", "User")
+        OldEmail = apps.get_model("mail", "Email")
+        a = OldUser.objects.create(username="a@example.com", email="a@example.com")
+        b = OldUser.objects.create(username="b@example.com", email="b@example.com")
+
+        def send(subject):
+            # The old compose view saved one copy per user
+            for user in (a, b):
+                copy = OldEmail.objects.create(user=user, sender=a, subject=subject, body="")
+                copy.recipients.add(b)
+
+        send("ping")
+        send("ping")
+        send("pong")
+        self.migrate("0003_indexes")
+
+        self.assertEqual(list(Email.objects.order_by("id").values_list("subject", flat=True)),
+                         ["ping", "ping", "pong"])
+        for folder, user in ((MailboxEntry.SENT, a), (MailboxEntry.INBOX, b)):
+            self.assertEqual(MailboxEntry.objects.filter(user_id=user.id, folder=folder).count(), 3)
+        self.assertEqual(MailboxEntry.objects.count(), 6)
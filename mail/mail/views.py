@@ -1,13 +1,62 @@
 import json
+from datetime import datetime, timedelta, timezone
+
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.db import IntegrityError
-from django.http import JsonResponse
+from django.db.models import Q
+from django.http import JsonResponse, StreamingHttpResponse
 from django.shortcuts import HttpResponse, HttpResponseRedirect, render
 from django.urls import reverse
 from django.views.decorators.csrf import csrf_exempt
 
-from .models import User, Email
+from .compose import resolve_recipients, send_email
+from .models import User, MailboxEntry
+from .serializers import stream_mailbox, summary_rows
+
+# Number of emails per page, unless ?limit= asks for fewer or more
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 100
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def encode_cursor(row):
+    micros = (row["timestamp"] - EPOCH) // timedelta(microseconds=1)
+    return f"{micros}-{row['id']}"
+
+
+def decode_cursor(cursor):
+    """
+    Returns the (timestamp, id) pair written by encode_cursor, or None
+    if the cursor is malformed.
+    """
+    micros, _, id = cursor.partition("-")
+    if not (micros.isdigit() and id.isdigit()):
+        return None
+    return EPOCH + timedelta(microseconds=int(micros)), int(id)
+
+
+def paginate(request, entries):
+    """
+    Returns one page of mailbox rows, newest first, and the cursor of
+    the next page (None on the last page). Pages are selected with
+    ?before=<cursor> on (timestamp, id) instead of an offset, so every
+    page costs the same however deep it is.
+    """
+    try:
+        limit = max(1, min(int(request.GET.get("limit", PAGE_SIZE)), MAX_PAGE_SIZE))
+    except ValueError:
+        limit = PAGE_SIZE
+    before = decode_cursor(request.GET.get("before", ""))
+    if before is not None:
+        timestamp, id = before
+        entries = entries.filter(Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=id))
+
+    # Fetch one more row to know if there is a next page
+    page = list(entries.order_by("-timestamp", "-id")[:limit + 1])
+    next_cursor = encode_cursor(page[limit - 1]) if len(page) > limit else None
+    return page[:limit], next_cursor
 
 
 def index(request):
@@ -32,42 +81,26 @@ def compose(request):
     # Check recipient emails
     data = json.loads(request.body)
     emails = [email.strip() for email in data.get("recipients").split(",")]
-    if emails == [""]:
+    emails = [email for email in emails if email]
+    if not emails:
         return JsonResponse({
             "error": "At least one recipient required."
         }, status=400)
 
-    # Convert email addresses to users
-    recipients = []
-    for email in emails:
-        try:
-            user = User.objects.get(email=email)
-            recipients.append(user)
-        except User.DoesNotExist:
-            return JsonResponse({
-                "error": f"User with email {email} does not exist."
-            }, status=400)
+    # Convert email addresses to users, reporting every unknown address
+    recipients, unknown = resolve_recipients(emails)
+    if unknown:
+        if len(unknown) == 1:
+            error = f"User with email {unknown[0]} does not exist."
+        else:
+            error = f"Users with emails {', '.join(unknown)} do not exist."
+        return JsonResponse({"error": error, "unknown": unknown}, status=400)
 
     # Get contents of email
     subject = data.get("subject", "")
     body = data.get("body", "")
 
-    # Create one email for each recipient, plus sender
-    users = set()
-    users.add(request.user)
-    users.update(recipients)
-    for user in users:
-        email = Email(
-            user=user,
-            sender=request.user,
-            subject=subject,
-            body=body,
-            read=user == request.user
-        )
-        email.save()
-        for recipient in recipients:
-            email.recipients.add(recipient)
-        email.save()
+    send_email(request.user, recipients, subject, body)
 
     return JsonResponse({"message": "Email sent successfully."}, status=201)
 
@@ -77,47 +110,52 @@ def mailbox(request, mailbox):
 
     # Filter emails returned based on mailbox
     if mailbox == "inbox":
-        emails = Email.objects.filter(
-            user=request.user, recipients=request.user, archived=False
+        entries = MailboxEntry.objects.filter(
+            user=request.user, folder=MailboxEntry.INBOX, archived=False
         )
     elif mailbox == "sent":
-        emails = Email.objects.filter(
-            user=request.user, sender=request.user
+        entries = MailboxEntry.objects.filter(
+            user=request.user, folder=MailboxEntry.SENT
         )
     elif mailbox == "archive":
-        emails = Email.objects.filter(
-            user=request.user, recipients=request.user, archived=True
+        entries = MailboxEntry.objects.filter(
+            user=request.user, folder=MailboxEntry.INBOX, archived=True
         )
     else:
         return JsonResponse({"error": "Invalid mailbox."}, status=400)
 
-    # Return emails in reverse chronological order
-    emails = emails.order_by("-timestamp").all()
-    return JsonResponse([email.serialize() for email in emails], safe=False)
+    # Return one page of emails in reverse chronological order, without
+    # their bodies
+    page, next_cursor = paginate(request, summary_rows(entries))
+    return StreamingHttpResponse(stream_mailbox(page, next_cursor),
+                                 content_type="application/json")
 
 
 @csrf_exempt
 @login_required
 def email(request, email_id):
 
-    # Query for requested email
-    try:
-        email = Email.objects.get(user=request.user, pk=email_id)
-    except Email.DoesNotExist:
+    # Query for requested email, preferring the inbox entry when the
+    # user sent it to themselves
+    entries = MailboxEntry.objects.filter(user=request.user, email_id=email_id)
+    entry = entries.select_related("email__sender").order_by("folder").first()
+    if entry is None:
         return JsonResponse({"error": "Email not found."}, status=404)
 
     # Return email contents
     if request.method == "GET":
-        return JsonResponse(email.serialize())
+        return JsonResponse(entry.serialize())
 
     # Update whether email is read or should be archived
     elif request.method == "PUT":
         data = json.loads(request.body)
+        changes = {}
         if data.get("read") is not None:
-            email.read = data["read"]
+            changes["read"] = data["read"]
         if data.get("archived") is not None:
-            email.archived = data["archived"]
-        email.save()
+            changes["archived"] = data["archived"]
+        if changes:
+            entries.update(**changes)
         return HttpResponse(status=204)
 
     # Email must be via GET or PUT
@@ -0,0 +1,316 @@
+import hashlib
+import io
+import os
+import re
+import secrets
+import sqlite3
+import threading
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.utils.module_loading import import_string
+
+
+
+class EntryBackend:
+    """
+    Base class for the places encyclopedia entries can be stored in.
+    """
+
+    def list_titles(self):
+        """
+        Returns the titles of all entries, in any order.
+        """
+        raise NotImplementedError
+
+    def get(self, title):
+        """
+        Returns the Markdown content of an entry, or None.
+        """
+        raise NotImplementedError
+
+    def open(self, title):
+        """
+        Returns a file object yielding the lines of an entry, or None.
+        """
+        content = self.get(title)
+        return None if content is None else io.StringIO(content, newline="")
+
+    def size(self, title):
+        """
+        Returns the size of an entry in bytes, or None.
+        """
+        content = self.get(title)
+        return None if content is None else len(content.encode("utf-8"))
+
+    def etag(self, title):
+        """
+        Returns a string that changes whenever the content of an entry
+        changes, or None if it does not exist.
+        """
+        content = self.get(title)
+        if content is None:
+            return None
+        return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+    def modified(self, title):
+        """
+        Returns when an entry was last changed, or None if unknown.
+        """
+        return None
+
+    def save(self, title, content):
+        """
+        Creates or replaces an entry.
+        """
+        raise NotImplementedError
+
+    def save_many(self, entries):
+        """
+        Saves an iterable of (title, content) pairs.
+        """
+        for title, content in entries:
+            self.save(title, content)
+
+    def stamp(self):
+        """
+        Returns a value that changes whenever an entry is added or
+        removed, even by another process.
+        """
+        raise NotImplementedError
+
+
+class FlatDirectoryBackend(EntryBackend):
+    """
+    Stores every entry as entries/<title>.md.
+    """
+
+    def _filename(self, title):
+        return f"entries/{title}.md"
+
+    def list_titles(self):
+        _, filenames = default_storage.listdir("entries")
+        return [re.sub(r"\.md$", "", filename)
+                for filename in filenames if filename.endswith(".md")]
+
+    def get(self, title):
+        try:
+            f = default_storage.open(self._filename(title))
+            return f.read().decode("utf-8")
+        except FileNotFoundError:
+            return None
+
+    def open(self, title):
+        try:
+            f = default_storage.open(self._filename(title), "rb")
+        except FileNotFoundError:
+            return None
+        return io.TextIOWrapper(f, encoding="utf-8", newline="")
+
+    def _stat(self, title):
+        try:
+            return os.stat(default_storage.path(self._filename(title)))
+        except FileNotFoundError:
+            return None
+
+    def size(self, title):
+        stat = self._stat(title)
+        return stat.st_size if stat else None
+
+    def etag(self, title):
+        # Saves replace the file, so its mtime and size identify the content
+        stat = self._stat(title)
+        return f"{stat.st_mtime_ns:x}-{stat.st_size:x}" if stat else None
+
+    def modified(self, title):
+        stat = self._stat(title)
+        return datetime.fromtimestamp(stat.st_mtime, timezone.utc) if stat else None
+
+    def save(self, title, content):
+        # Write to a temporary file next to the entry and move it into
+        # place, so readers always see either the old or the new page
+        path = default_storage.path(self._filename(title))
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        # Created like the storage creates files, so the umask applies
+        while True:
+            temp = os.path.join(directory, f".{secrets.token_hex(8)}.tmp")
+            try:
+                fd = os.open(temp, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o666)
+                break
+            except FileExistsError:
+                continue
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(content.encode("utf-8"))
+                f.flush()
+                os.fsync(f.fileno())
+            if settings.FILE_UPLOAD_PERMISSIONS is not None:
+                os.chmod(temp, settings.FILE_UPLOAD_PERMISSIONS)
+            os.replace(temp, path)
+        except BaseException:
+            os.remove(temp)
+            raise
+
+    def stamp(self):
+        return default_storage.get_modified_time("entries")
+
+
+class ShardedDirectoryBackend(FlatDirectoryBackend):
+    """
+    Spreads entries over 256 subdirectories of entries/, picked by the
+    hash of the title, so no directory grows too large.
+
+    Saving a new title touches entries/.stamp, so the stamp is a single
+    stat. Anything adding or removing entry files by other means must
+    touch it too: unlike the flat directory's stamp, this one does not
+    notice entries removed, or added, outside save.
+    """
+
+    STAMP = "entries/.stamp"
+
+    def _shard(self, title):
+        return hashlib.md5(title.encode("utf-8")).hexdigest()[:2]
+
+    def _filename(self, title):
+        return f"entries/{self._shard(title)}/{title}.md"
+
+    def list_titles(self):
+        titles = []
+        shards, _ = default_storage.listdir("entries")
+        for shard in shards:
+            _, filenames = default_storage.listdir(f"entries/{shard}")
+            titles.extend(re.sub(r"\.md$", "", filename)
+                          for filename in filenames if filename.endswith(".md"))
+        return titles
+
+    def save(self, title, content):
+        added = self._stat(title) is None
+        super().save(title, content)
+        if added:
+            self._touch()
+
+    def _touch(self):
+        path = default_storage.path(self.STAMP)
+        with open(path, "a"):
+            os.utime(path)
+
+    def stamp(self):
+        try:
+            return os.stat(default_storage.path(self.STAMP)).st_mtime_ns
+        except FileNotFoundError:
+            self._touch()
+            return self.stamp()
+
+
+class SQLiteBackend(EntryBackend):
+    """
+    Stores all entries in a single SQLite file, with an FTS5 table over
+    titles and content for full-text search.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS entries (
+        id INTEGER PRIMARY KEY,
+        title TEXT NOT NULL UNIQUE,
+        content TEXT NOT NULL
+    );
+    CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts USING fts5(
+        title, content, content='entries', content_rowid='id'
+    );
+    CREATE TABLE IF NOT EXISTS version (
+        value INTEGER NOT NULL
+    );
+    INSERT INTO version SELECT 0 WHERE NOT EXISTS (SELECT * FROM version);
+    CREATE TRIGGER IF NOT EXISTS entries_insert AFTER INSERT ON entries BEGIN
+        INSERT INTO entries_fts (rowid, title, content)
+            VALUES (new.id, new.title, new.content);
+        UPDATE version SET value = value + 1;
+    END;
+    CREATE TRIGGER IF NOT EXISTS entries_delete AFTER DELETE ON entries BEGIN
+        INSERT INTO entries_fts (entries_fts, rowid, title, content)
+            VALUES ('delete', old.id, old.title, old.content);
+        UPDATE version SET value = value + 1;
+    END;
+    CREATE TRIGGER IF NOT EXISTS entries_update AFTER UPDATE ON entries BEGIN
+        INSERT INTO entries_fts (entries_fts, rowid, title, content)
+            VALUES ('delete', old.id, old.title, old.content);
+        INSERT INTO entries_fts (rowid, title, content)
+            VALUES (new.id, new.title, new.content);
+    END;
+    """
+
+    def __init__(self):
+        self.path = settings.ENTRIES_DATABASE
+        self._local = threading.local()
+
+    def _connection(self):
+        # sqlite3 connections cannot be shared between threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.executescript(self.SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def list_titles(self):
+        return [title for title, in
+                self._connection().execute("SELECT title FROM entries")]
+
+    def get(self, title):
+        row = self._connection().execute(
+            "SELECT content FROM entries WHERE title = ?", (title,)).fetchone()
+        return row[0] if row else None
+
+    def size(self, title):
+        row = self._connection().execute(
+            "SELECT length(CAST(content AS BLOB)) FROM entries WHERE title = ?",
+            (title,)).fetchone()
+        return row[0] if row else None
+
+    def save(self, title, content):
+        self.save_many([(title, content)])
+
+    def save_many(self, entries):
+        conn = self._connection()
+        with conn:
+            conn.executemany(
+                "INSERT INTO entries (title, content) VALUES (?, ?) "
+                "ON CONFLICT (title) DO UPDATE SET content = excluded.content",
+                entries)
+
+    def stamp(self):
+        return self._connection().execute(
+            "SELECT value FROM version").fetchone()[0]
+
+    def search(self, query, limit=20):
+        """
+        Returns up to `limit` (title, snippet) pairs ranked by FTS5's
+        BM25, best match first.
+        """
+        terms = re.findall(r"\w+", query)
+        if not terms:
+            return []
+        match = " OR ".join(f'"{term}"' for term in terms)
+        return self._connection().execute(
+            "SELECT title, snippet(entries_fts, 1, '', '', '...', 16) "
+            "FROM entries_fts WHERE entries_fts MATCH ? "
+            "ORDER BY rank LIMIT ?", (match, limit)).fetchall()
+
+
+BACKENDS = {
+    "flat": "encyclopedia.backends.FlatDirectoryBackend",
+    "sharded": "encyclopedia.backends.ShardedDirectoryBackend",
+    "sqlite": "encyclopedia.backends.SQLiteBackend",
+}
+
+
+def get_backend(name=None):
+    """
+    Returns an instance of the named backend, or of the one configured
+    in settings.ENTRIES_BACKEND. Names may be a key of BACKENDS or a
+    dotted path to a class.
+    """
+    name = name or settings.ENTRIES_BACKEND
+    return import_string(BACKENDS.get(name, name))()
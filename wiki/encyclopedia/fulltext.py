@@ -0,0 +1,283 @@
+import heapq
+import math
+import re
+import sqlite3
+import threading
+from collections import Counter
+
+from django.conf import settings
+
+
+TOKEN = re.compile(r"\w+")
+
+# BM25 tuning parameters
+K1 = 1.2
+B = 0.75
+
+# Bumped whenever the layout of the tables changes
+VERSION = 2
+
+# Every posting stores its BM25 term weight, computed with the average
+# document length at the time it was written, so the postings of a term
+# can be read best first and the search can stop early. Rebuilding the
+# index refreshes the weights.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    title TEXT PRIMARY KEY,
+    length INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS postings (
+    term TEXT NOT NULL,
+    title TEXT NOT NULL,
+    tf INTEGER NOT NULL,
+    weight REAL NOT NULL,
+    PRIMARY KEY (term, title)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS terms (
+    term TEXT PRIMARY KEY,
+    df INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS stats (
+    name TEXT PRIMARY KEY,
+    value
+);
+INSERT OR IGNORE INTO stats VALUES ('documents', 0), ('length', 0), ('stamp', NULL);
+"""
+
+INDEXES = [
+    "CREATE INDEX IF NOT EXISTS postings_title ON postings (title)",
+    "CREATE INDEX IF NOT EXISTS postings_weight ON postings (term, weight DESC)",
+]
+
+
+# sqlite3 connections cannot be shared between threads
+_local = threading.local()
+
+
+def _connection():
+    """
+    Returns this thread's connection to the on-disk index, creating the
+    tables the first time.
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(settings.SEARCH_INDEX, timeout=30)
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version not in (0, VERSION):
+            # Written by an older version, start again
+            conn.executescript("DROP TABLE IF EXISTS postings; "
+                               "DROP TABLE IF EXISTS documents; PRAGMA user_version = 0;")
+        conn.executescript(SCHEMA)
+        for index in INDEXES:
+            conn.execute(index)
+        _local.conn = conn
+    return conn
+
+
+def tokenize(text):
+    """
+    Splits text into lowercase word tokens.
+    """
+    return TOKEN.findall(text.casefold())
+
+
+def _stat(conn, name):
+    return conn.execute("SELECT value FROM stats WHERE name = ?", (name,)).fetchone()[0]
+
+
+def _weight(tf, length, average):
+    return tf * (K1 + 1) / (tf + K1 * (1 - B + B * length / average))
+
+
+def _remove(conn, title):
+    row = conn.execute("SELECT length FROM documents WHERE title = ?", (title,)).fetchone()
+    if row is None:
+        return
+    conn.execute("UPDATE terms SET df = df - 1 WHERE term IN "
+                 "(SELECT term FROM postings WHERE title = ?)", (title,))
+    conn.execute("DELETE FROM postings WHERE title = ?", (title,))
+    conn.execute("DELETE FROM documents WHERE title = ?", (title,))
+    conn.execute("UPDATE stats SET value = value - 1 WHERE name = 'documents'")
+    conn.execute("UPDATE stats SET value = value - ? WHERE name = 'length'", (row[0],))
+
+
+def _write(conn, title, content):
+    _remove(conn, title)
+    if content is None:
+        return
+    tokens = tokenize(content)
+    conn.execute("INSERT INTO documents VALUES (?, ?)", (title, len(tokens)))
+    conn.execute("UPDATE stats SET value = value + 1 WHERE name = 'documents'")
+    conn.execute("UPDATE stats SET value = value + ? WHERE name = 'length'", (len(tokens),))
+    average = max(_stat(conn, "length") / _stat(conn, "documents"), 1)
+    counts = Counter(tokens)
+    conn.executemany("INSERT INTO postings VALUES (?, ?, ?, ?)",
+                     ((term, title, tf, _weight(tf, len(tokens), average))
+                      for term, tf in counts.items()))
+    conn.executemany("INSERT INTO terms VALUES (?, 1) "
+                     "ON CONFLICT (term) DO UPDATE SET df = df + 1",
+                     ((term,) for term in counts))
+
+
+def is_built():
+    """
+    Returns True once the index has been built from the entries.
+    """
+    return _connection().execute("PRAGMA user_version").fetchone()[0] == VERSION
+
+
+def stamp():
+    """
+    Returns the backend stamp the index was last known to match, as a
+    string, or None.
+    """
+    return _stat(_connection(), "stamp")
+
+
+def set_stamp(value):
+    conn = _connection()
+    with conn:
+        conn.execute("UPDATE stats SET value = ? WHERE name = 'stamp'", (str(value),))
+
+
+def titles():
+    """
+    Returns the titles of all indexed entries.
+    """
+    return [title for title, in _connection().execute("SELECT title FROM documents")]
+
+
+def rebuild(entries):
+    """
+    Replaces the whole index with the given (title, content) pairs.
+    """
+    conn = _connection()
+    with conn:
+        conn.execute("DELETE FROM postings")
+        conn.execute("DELETE FROM documents")
+        conn.execute("DELETE FROM terms")
+        conn.execute("DROP INDEX IF EXISTS postings_title")
+        conn.execute("DROP INDEX IF EXISTS postings_weight")
+
+        # Collect the postings unsorted first, as the weights need the
+        # average length of all documents
+        conn.execute("CREATE TEMP TABLE staging (term TEXT, title TEXT, tf INTEGER)")
+        count = total = 0
+        for title, content in entries:
+            if content is None:
+                continue
+            tokens = tokenize(content)
+            conn.execute("INSERT INTO documents VALUES (?, ?)", (title, len(tokens)))
+            conn.executemany("INSERT INTO staging VALUES (?, ?, ?)",
+                             ((term, title, tf) for term, tf in Counter(tokens).items()))
+            count += 1
+            total += len(tokens)
+
+        conn.create_function("bm25_weight", 3, _weight, deterministic=True)
+        conn.execute("INSERT INTO postings SELECT s.term, s.title, s.tf, "
+                     "bm25_weight(s.tf, d.length, ?) FROM staging s "
+                     "JOIN documents d ON d.title = s.title ORDER BY s.term, s.title",
+                     (max(total / count, 1) if count else 1,))
+        conn.execute("DROP TABLE staging")
+        conn.execute("INSERT INTO terms SELECT term, COUNT(*) FROM postings GROUP BY term")
+        conn.execute("UPDATE stats SET value = ? WHERE name = 'documents'", (count,))
+        conn.execute("UPDATE stats SET value = ? WHERE name = 'length'", (total,))
+        for index in INDEXES:
+            conn.execute(index)
+    conn.execute(f"PRAGMA user_version = {VERSION}")
+
+
+def index_entry(title, content):
+    """
+    Replaces the postings of a single entry.
+    """
+    index_entries([(title, content)])
+
+
+def index_entries(entries):
+    """
+    Replaces the postings of many (title, content) pairs in a single
+    transaction. A content of None removes the entry.
+    """
+    conn = _connection()
+    with conn:
+        for title, content in entries:
+            _write(conn, title, content)
+
+
+def search(query, limit=20):
+    """
+    Returns up to `limit` (title, score) pairs for the entries that best
+    match the query, ranked by BM25.
+
+    The postings of each term are read best first, a batch at a time,
+    and reading stops once no unseen entry could beat the current top
+    results (the threshold algorithm), so common terms do not cost a
+    pass over all their postings.
+    """
+    terms = sorted(set(tokenize(query)))
+    if not terms:
+        return []
+    conn = _connection()
+    count = _stat(conn, "documents")
+    if not count:
+        return []
+    idf = {}
+    for term in terms:
+        row = conn.execute("SELECT df FROM terms WHERE term = ?", (term,)).fetchone()
+        if row and row[0] > 0:
+            idf[term] = math.log(1 + (count - row[0] + 0.5) / (row[0] + 0.5))
+    if not idf:
+        return []
+
+    postings = {term: conn.execute(
+        "SELECT title, weight FROM postings WHERE term = ? ORDER BY weight DESC", (term,))
+        for term in idf}
+    # Highest score an entry not seen yet could still get from each term
+    bounds = dict.fromkeys(idf, math.inf)
+    scores = {}
+    size = limit
+    while postings:
+        seen = set()
+        for term, cursor in list(postings.items()):
+            rows = cursor.fetchmany(size)
+            if len(rows) < size:
+                del postings[term]
+                bounds[term] = 0
+            if rows:
+                bounds[term] = min(bounds[term], idf[term] * rows[-1][1])
+            seen.update(title for title, _ in rows if title not in scores)
+
+        # Score the new entries fully, looking up their other terms
+        for title in seen:
+            scores[title] = 0.0
+        seen = list(seen)
+        for start in range(0, len(seen), 500):
+            chunk = seen[start:start + 500]
+            for term in idf:
+                rows = conn.execute(
+                    "SELECT title, weight FROM postings WHERE term = ? AND title IN "
+                    f"({','.join('?' * len(chunk))})", [term] + chunk)
+                for title, weight in rows:
+                    scores[title] += idf[term] * weight
+
+        best = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+        if len(best) == limit and best[-1][1] >= sum(bounds.values()):
+            break
+        size *= 2
+    return heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+
+
+def snippet(content, query, width=80):
+    """
+    Returns a short excerpt of the content around the first match of
+    any query term.
+    """
+    terms = set(tokenize(query))
+    for match in TOKEN.finditer(content):
+        if match.group().casefold() in terms:
+            start = max(match.start() - width // 2, 0)
+            end = start + width
+            text = " ".join(content[start:end].split())
+            return ("..." if start else "") + text + ("..." if end < len(content) else "")
+    return " ".join(content[:width].split())
@@ -0,0 +1,69 @@
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from encyclopedia.backends import BACKENDS, get_backend
+
+
+class Command(BaseCommand):
+    help = ("Compares the storage backends on generated entries, each in its own "
+            "temporary directory.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--entries", type=int, default=10000)
+        parser.add_argument("--reads", type=int, default=1000)
+        parser.add_argument("--backend", action="append", choices=list(BACKENDS),
+                            help="Backend to measure, all of them if not given.")
+
+    def handle(self, *args, **options):
+        entries = [(f"Entry {i}", f"# Entry {i}\n\nSome text about topic {i % 100}.\n")
+                   for i in range(options["entries"])]
+        reads = random.Random(0).choices([title for title, _ in entries], k=options["reads"])
+
+        self.stdout.write(f"{'backend':10}{'save_many':>12}{'list':>12}{'get':>12}"
+                          f"{'stamp':>12}{'search':>12}")
+        for name in options["backend"] or BACKENDS:
+            root = tempfile.mkdtemp()
+            try:
+                os.makedirs(os.path.join(root, "entries"))
+                with override_settings(MEDIA_ROOT=root,
+                                       ENTRIES_DATABASE=os.path.join(root, "entries.sqlite3")):
+                    self.stdout.write(f"{name:10}" + "".join(
+                        f"{timing:>12}" for timing in self.measure(get_backend(name), entries, reads)))
+            finally:
+                shutil.rmtree(root)
+        self.stdout.write("save_many is for all entries, get for one read, "
+                          "the others for one call.")
+
+    def measure(self, backend, entries, reads):
+        """
+        Yields formatted timings of the main backend operations.
+        """
+        start = time.perf_counter()
+        backend.save_many(entries)
+        yield f"{time.perf_counter() - start:.2f}s"
+
+        start = time.perf_counter()
+        backend.list_titles()
+        yield f"{(time.perf_counter() - start) * 1000:.1f}ms"
+
+        start = time.perf_counter()
+        for title in reads:
+            backend.get(title)
+        yield f"{(time.perf_counter() - start) / len(reads) * 1e6:.0f}us"
+
+        start = time.perf_counter()
+        backend.stamp()
+        yield f"{(time.perf_counter() - start) * 1e6:.0f}us"
+
+        if hasattr(backend, "search"):
+            start = time.perf_counter()
+            backend.search("topic 42")
+            yield f"{(time.perf_counter() - start) * 1000:.1f}ms"
+        else:
+            yield "-"
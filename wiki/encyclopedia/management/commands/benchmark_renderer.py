@@ -0,0 +1,55 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from encyclopedia import renderer
+
+
+def generate_entry(lines):
+    """
+    Returns a Markdown page of about `lines` lines mixing every syntax
+    the renderer knows.
+    """
+    blocks = []
+    for i in range(0, lines, 10):
+        blocks += [
+            f"## Section {i}",
+            "",
+            f"Some **bold** text, some *italic* text and a [link](/wiki/Page{i}/).",
+            f"1. First item {i}",
+            "2. Second item with **bold**",
+            f"- Bullet {i}",
+            "* Another bullet",
+            "+ A [linked](/wiki/Other/) bullet",
+            "",
+            "A closing paragraph.",
+        ]
+    return "\n".join(blocks[:lines])
+
+
+class Command(BaseCommand):
+    help = "Measures how many large generated entries the renderer converts per second."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--pages", type=int, default=50)
+        parser.add_argument("--lines", type=int, default=10000)
+
+    def handle(self, *args, **options):
+        pages = [generate_entry(options["lines"]) for _ in range(options["pages"])]
+        size = sum(len(page) for page in pages) / len(pages) / 1024
+
+        start = time.perf_counter()
+        for page in pages:
+            renderer.render(page)
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f"render:       {len(pages) / elapsed:10.1f} pages/s "
+                          f"({size:.0f} KiB per page)")
+
+        # Every title is rendered once, then served from the cache
+        for number, page in enumerate(pages):
+            renderer.render_entry(f"Benchmark {number}", page)
+        start = time.perf_counter()
+        for number, page in enumerate(pages):
+            renderer.render_entry(f"Benchmark {number}", page)
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f"cached pages: {len(pages) / elapsed:10.1f} pages/s")
@@ -0,0 +1,18 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from encyclopedia import fulltext, util
+
+
+class Command(BaseCommand):
+    help = "Builds the full-text index used to search the content of entries."
+
+    def handle(self, *args, **options):
+        if hasattr(util.backend(), "search"):
+            self.stdout.write("This storage backend has its own search index.")
+            return
+        start = time.monotonic()
+        util.rebuild_search_index()
+        self.stdout.write(self.style.SUCCESS(
+            f"Indexed {len(fulltext.titles())} entries in {time.monotonic() - start:.1f}s."))
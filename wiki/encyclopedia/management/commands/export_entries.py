@@ -0,0 +1,49 @@
+import gzip
+import io
+import json
+import tarfile
+
+from django.core.management.base import BaseCommand
+
+from encyclopedia import util
+
+
+class Command(BaseCommand):
+    help = "Writes all encyclopedia entries to a tar or JSONL archive."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--format", choices=["tar", "jsonl"],
+                            help="Guessed from the file name if not given.")
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        fmt = options["format"] or ("jsonl" if ".jsonl" in path else "tar")
+
+        count = 0
+        if fmt == "jsonl":
+            opener = gzip.open if path.endswith(".gz") else open
+            with opener(path, "wt", encoding="utf-8") as f:
+                for title, content in self.entries():
+                    f.write(json.dumps({"title": title, "content": content}) + "\n")
+                    count += 1
+        else:
+            mode = "w:gz" if path.endswith("gz") else "w"
+            with tarfile.open(path, mode) as archive:
+                for title, content in self.entries():
+                    data = content.encode("utf-8")
+                    member = tarfile.TarInfo(f"entries/{title}.md")
+                    member.size = len(data)
+                    archive.addfile(member, io.BytesIO(data))
+                    count += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Exported {count} entries."))
+
+    def entries(self):
+        """
+        Yields (title, content) pairs one entry at a time.
+        """
+        for title in util.list_entries():
+            content = util.get_entry(title)
+            if content is not None:
+                yield title, content
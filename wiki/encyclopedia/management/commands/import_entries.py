@@ -0,0 +1,85 @@
+import gzip
+import json
+import os
+import tarfile
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.core.management.base import BaseCommand
+
+from encyclopedia import util
+
+
+def read_tar(path):
+    """
+    Yields (title, content) pairs from the .md files of a tar archive.
+    """
+    with tarfile.open(path, "r:*") as archive:
+        for member in archive:
+            name = os.path.basename(member.name)
+            if member.isfile() and name.endswith(".md"):
+                content = archive.extractfile(member).read().decode("utf-8")
+                yield name[:-len(".md")], content
+
+
+def read_jsonl(path):
+    """
+    Yields (title, content) pairs from a file with one
+    {"title": ..., "content": ...} object per line.
+    """
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                yield entry["title"], entry["content"]
+
+
+class Command(BaseCommand):
+    help = "Loads encyclopedia entries from a tar or JSONL archive."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--format", choices=["tar", "jsonl"],
+                            help="Guessed from the file name if not given.")
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument("--workers", type=int, default=4)
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        fmt = options["format"] or ("jsonl" if ".jsonl" in path else "tar")
+        entries = read_jsonl(path) if fmt == "jsonl" else read_tar(path)
+        size = options["batch_size"]
+        workers = options["workers"]
+
+        count = 0
+        skipped = 0
+        pending = set()
+        batch = []
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for title, content in entries:
+                # Titles become file names and URL parts
+                if not util.valid_title(title):
+                    skipped += 1
+                    continue
+                batch.append((title, content))
+                if len(batch) == size:
+                    pending.add(executor.submit(util.save_entries, batch))
+                    count += len(batch)
+                    batch = []
+
+                # Only keep a few batches in memory at a time
+                if len(pending) >= workers * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        future.result()
+
+            if batch:
+                pending.add(executor.submit(util.save_entries, batch))
+                count += len(batch)
+            for future in pending:
+                future.result()
+
+        util.rebuild_index()
+        if skipped:
+            self.stderr.write(f"Skipped {skipped} entries with an empty title or a '/', '\\' or '..' in it.")
+        self.stdout.write(self.style.SUCCESS(f"Imported {count} entries."))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from encyclopedia.backends import BACKENDS, get_backend
+
+
+class Command(BaseCommand):
+    help = "Copies all encyclopedia entries from one storage backend to another."
+
+    def add_arguments(self, parser):
+        parser.add_argument("source", help=f"One of {', '.join(BACKENDS)} or a dotted path.")
+        parser.add_argument("target", help=f"One of {', '.join(BACKENDS)} or a dotted path.")
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        source = get_backend(options["source"])
+        target = get_backend(options["target"])
+        size = options["batch_size"]
+
+        # Copy in batches so only one batch is held in memory
+        batch = []
+        count = 0
+        for title in source.list_titles():
+            batch.append((title, source.get(title)))
+            if len(batch) == size:
+                target.save_many(batch)
+                count += len(batch)
+                batch = []
+        target.save_many(batch)
+        count += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(f"Copied {count} entries. The source backend was left as it was."))
+        self.stdout.write("Set ENTRIES_BACKEND in settings.py to use the new backend.")
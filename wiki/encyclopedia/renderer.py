@@ -0,0 +1,120 @@
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+
+
+HEADING = re.compile(r"^(#{1,6}) (.*)$")
+ORDERED_ITEM = re.compile(r"^\d+\. (.*)$")
+UNORDERED_ITEM = re.compile(r"^[\*\-\+] (.*)$")
+BOLD = re.compile(r"\*\*(.*?)\*\*")
+ITALIC = re.compile(r"\*(.*?)\*")
+LINK = re.compile(r"\[([^\]]+)\]\(([^)]+)\)")
+
+# Rendered HTML of the most recently viewed entries, keyed by title and
+# stored together with the hash of the Markdown it was rendered from.
+# The least recently used entry is dropped once CACHE_SIZE is reached.
+CACHE_SIZE = 256
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _inline(text):
+    """
+    Applies bold, italic and link formatting to a line of text.
+    """
+    text = BOLD.sub(r"<b>\1</b>", text)
+    text = ITALIC.sub(r"<i>\1</i>", text)
+    return LINK.sub(r'<a href="\2">\1</a>', text)
+
+
+def render_blocks(lines):
+    """
+    Converts an iterable of Markdown lines to HTML in a single pass,
+    yielding one block of HTML per line.
+    """
+    open_list = None
+    for line in lines:
+        line = line.rstrip("\r\n")
+
+        heading = HEADING.match(line)
+        if heading:
+            item, tag = None, None
+        else:
+            item = ORDERED_ITEM.match(line)
+            tag = "ol"
+            if not item:
+                item = UNORDERED_ITEM.match(line)
+                tag = "ul"
+
+        # Close the current list when it does not continue
+        prefix = ""
+        if open_list and (not item or tag != open_list):
+            prefix = f"</{open_list}>"
+            open_list = None
+
+        if heading:
+            level = len(heading.group(1))
+            html = f"<h{level}>{_inline(heading.group(2))}</h{level}>"
+        elif item:
+            html = f"<li>{_inline(item.group(1))}</li>"
+            if not open_list:
+                html = f"<{tag}>" + html
+                open_list = tag
+        elif line.strip():
+            html = f"<p>{_inline(line)}</p>"
+        else:
+            html = ""
+        yield prefix + html
+
+    if open_list:
+        yield f"</{open_list}>"
+
+
+def render(content):
+    """
+    Converts Markdown content to HTML.
+    """
+    return "\n".join(render_blocks(content.split("\n")))
+
+
+def stream(lines):
+    """
+    Converts Markdown lines to HTML lazily, for entries too large to
+    hold in memory more than once.
+    """
+    for number, html in enumerate(render_blocks(_split_lines(lines))):
+        yield html if number == 0 else "\n" + html
+
+
+def _split_lines(lines):
+    """
+    Yields the lines of a file the way str.split("\n") splits its text,
+    with an empty last line after a final newline, so streamed pages
+    match rendered ones.
+    """
+    line = ""
+    for line in lines:
+        yield line
+    if line == "" or line.endswith("\n"):
+        yield ""
+
+
+def render_entry(title, content):
+    """
+    Returns the HTML for an entry, rendering it only if its content
+    changed since the last time it was rendered.
+    """
+    digest = hashlib.sha1(content.encode("utf-8")).hexdigest()
+    with _cache_lock:
+        cached = _cache.get(title)
+        if cached and cached[0] == digest:
+            _cache.move_to_end(title)
+            return cached[1]
+    html = render(content)
+    with _cache_lock:
+        _cache[title] = (digest, html)
+        _cache.move_to_end(title)
+        if len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return html
@@ -0,0 +1,178 @@
+import difflib
+import hashlib
+import json
+import os
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils._os import safe_join
+
+try:
+    import fcntl
+except ImportError:
+    # Windows has no flock, so only saves within this process are ordered
+    fcntl = None
+
+_lock = threading.Lock()
+
+
+# Every entry has an append-only log in REVISIONS_ROOT with one JSON
+# line per save. A line stores only the changed lines relative to the
+# previous revision, unless the entry was changed outside save_entry,
+# in which case the full text is stored again. Changes spanning more
+# than DIFF_LINES lines are stored as the full text too.
+DIFF_LINES = 1000
+
+
+def _path(title):
+    # Raises SuspiciousFileOperation for titles leaving REVISIONS_ROOT
+    return safe_join(settings.REVISIONS_ROOT, f"{title}.jsonl")
+
+
+def _digest(content):
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+
+def _read(title):
+    try:
+        with open(_path(title), encoding="utf-8") as f:
+            return [json.loads(line) for line in f]
+    except FileNotFoundError:
+        return []
+
+
+def _last_digest(title):
+    """
+    Returns the hash of the newest revision, reading the log backwards
+    so long histories are not parsed on every save.
+    """
+    try:
+        with open(_path(title), "rb") as f:
+            # Skip the newline ending the last line
+            position = f.seek(0, os.SEEK_END) - 1
+            chunks = []
+            while position > 0:
+                start = max(position - 4096, 0)
+                f.seek(start)
+                chunk = f.read(position - start)
+                newline = chunk.rfind(b"\n")
+                if newline >= 0:
+                    chunks.append(chunk[newline + 1:])
+                    break
+                chunks.append(chunk)
+                position = start
+    except FileNotFoundError:
+        return None
+    line = b"".join(reversed(chunks))
+    return json.loads(line)["sha1"] if line else None
+
+
+def _changes(old, new):
+    """
+    Returns the edits turning the lines of `old` into the lines of
+    `new`, as [start, end, replacement lines] lists, or None if the
+    changed part is too large to diff quickly.
+    """
+    # Most edits touch one place, so skip the lines both versions share
+    # at the start and at the end before diffing
+    prefix = 0
+    limit = min(len(old), len(new))
+    while prefix < limit and old[prefix] == new[prefix]:
+        prefix += 1
+    suffix = 0
+    limit -= prefix
+    while suffix < limit and old[-suffix - 1] == new[-suffix - 1]:
+        suffix += 1
+    old = old[prefix:len(old) - suffix]
+    new = new[prefix:len(new) - suffix]
+    if max(len(old), len(new)) > DIFF_LINES:
+        return None
+
+    matcher = difflib.SequenceMatcher(None, old, new)
+    return [[prefix + i1, prefix + i2, new[j1:j2]]
+            for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag != "equal"]
+
+
+def _snapshot(content):
+    return {"time": timezone.now().isoformat(), "sha1": _digest(content),
+            "full": True, "changes": [[0, 0, content.splitlines(True)]]}
+
+
+def _append(title, revision):
+    os.makedirs(settings.REVISIONS_ROOT, exist_ok=True)
+    with open(_path(title), "a", encoding="utf-8") as f:
+        f.write(json.dumps(revision) + "\n")
+
+
+@contextmanager
+def lock(title):
+    """
+    Holds an exclusive lock on an entry's log, so saves of the same
+    title never diff against the same old version, even when they run
+    in different processes.
+    """
+    os.makedirs(settings.REVISIONS_ROOT, exist_ok=True)
+    with open(_path(title), "ab") as f:
+        if fcntl is None:
+            with _lock:
+                yield
+        else:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def record(title, old, new):
+    """
+    Appends a revision to an entry's log, given its previous content
+    (or None for a new entry) and its new content. Call it while
+    holding lock(title).
+    """
+    old = old or ""
+    if old and _last_digest(title) != _digest(old):
+        # Keep the version we did not see being written
+        _append(title, _snapshot(old))
+    changes = _changes(old.splitlines(True), new.splitlines(True))
+    if changes is None:
+        _append(title, _snapshot(new))
+    else:
+        _append(title, {"time": timezone.now().isoformat(), "sha1": _digest(new),
+                        "full": False, "changes": changes})
+
+
+def list_revisions(title):
+    """
+    Returns a list of dicts describing every revision of an entry,
+    oldest first, with the number of lines added and removed.
+    """
+    revisions = []
+    for number, revision in enumerate(_read(title), 1):
+        revisions.append({
+            "number": number,
+            "time": revision["time"],
+            "added": sum(len(lines) for _, _, lines in revision["changes"]),
+            "removed": sum(end - start for start, end, _ in revision["changes"]),
+        })
+    return revisions
+
+
+def get_revision(title, number):
+    """
+    Rebuilds the content of an entry as of the given revision number,
+    or returns None if there is no such revision.
+    """
+    revisions = _read(title)[:number]
+    if number < 1 or len(revisions) < number:
+        return None
+    lines = []
+    for revision in revisions:
+        if revision["full"]:
+            lines = []
+        # Apply from the end so earlier positions stay valid
+        for start, end, replacement in reversed(revision["changes"]):
+            lines[start:end] = replacement
+    return "".join(lines)
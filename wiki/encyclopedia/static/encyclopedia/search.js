@@ -0,0 +1,31 @@
+document.addEventListener('DOMContentLoaded', function() {
+
+  const input = document.querySelector('.search');
+  const datalist = document.querySelector('#suggestions');
+  let latest = '';
+
+  // Fill the datalist with matching titles while typing
+  input.addEventListener('input', () => {
+    const query = input.value.trim();
+    latest = query;
+    if (query === '') {
+      datalist.innerHTML = '';
+      return;
+    }
+
+    fetch(`${input.dataset.url}?q=${encodeURIComponent(query)}`)
+    .then(response => response.json())
+    .then(data => {
+      // Ignore answers to older queries
+      if (query !== latest) {
+        return;
+      }
+      datalist.innerHTML = '';
+      data.results.forEach(title => {
+        const option = document.createElement('option');
+        option.value = title;
+        datalist.append(option);
+      })
+    })
+  })
+});
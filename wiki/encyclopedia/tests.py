@@ -1,3 +1,487 @@
-from django.test import TestCase
+import io
+import json
+import math
+import os
+import shutil
+import tempfile
+import threading
+import time
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.http import StreamingHttpResponse
+from django.test import TestCase, override_settings
+
+from . import fulltext, renderer, revisions, util
+from .backends import get_backend
+
+
+class WikiTestCase(TestCase):
+    """
+    Runs each test against empty entries, revisions and search index in
+    a temporary directory.
+    """
+
+    backend = "flat"
+
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        os.makedirs(os.path.join(root, "entries"))
+        overrides = override_settings(
+            MEDIA_ROOT=root,
+            ENTRIES_BACKEND=self.backend,
+            ENTRIES_DATABASE=os.path.join(root, "entries.sqlite3"),
+            REVISIONS_ROOT=os.path.join(root, "revisions"),
+            SEARCH_INDEX=os.path.join(root, "search_index.sqlite3"),
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.addCleanup(self.reset)
+        self.reset()
+
+    def reset(self):
+        # Forget the backend, indexes and connections of the last test
+        util._backend = None
+        util._stamp = None
+        fulltext._local.conn = None
+        cache.clear()
+
+    def write_outside(self, title, content):
+        """
+        Changes an entry file without going through save_entry.
+        """
+        with open(default_storage.path(util.backend()._filename(title)), "w",
+                  encoding="utf-8", newline="") as f:
+            f.write(content)
+
+
+class BackendTests(WikiTestCase):
+
+    def test_file_permissions(self):
+        util.save_entry("Python", "A language.\n")
+        path = default_storage.path(util.backend()._filename("Python"))
+        self.assertEqual(os.stat(path).st_mode & 0o777, 0o644)
+
+        with override_settings(FILE_UPLOAD_PERMISSIONS=0o600):
+            util.save_entry("Python", "A programming language.\n")
+        self.assertEqual(os.stat(path).st_mode & 0o777, 0o600)
+
+        # Without a setting, saves get the mode any new file would get
+        reference = default_storage.path("reference")
+        open(reference, "w").close()
+        with override_settings(FILE_UPLOAD_PERMISSIONS=None):
+            util.save_entry("Python", "A language.\n")
+        self.assertEqual(os.stat(path).st_mode & 0o777, os.stat(reference).st_mode & 0o777)
+
+    def test_titles_stay_inside_storage(self):
+        outside = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, outside)
+        for title in (os.path.relpath(os.path.join(outside, "pwned"), settings.REVISIONS_ROOT),
+                      "../entries/x", "a\\b", ""):
+            response = self.client.post("/create", {"title": title, "content": "x"}, follow=True)
+            self.assertContains(response, "Titles cannot be empty")
+            with self.assertRaises(ValueError):
+                util.save_entry(title, "x")
+        self.assertEqual(os.listdir(outside), [])
+        self.assertEqual(os.listdir(default_storage.path("entries")), [])
+        self.assertFalse(os.path.exists(settings.REVISIONS_ROOT))
+        with self.assertRaises(SuspiciousFileOperation):
+            revisions.list_revisions("../entries/x")
+
+
+class ShardedBackendTests(WikiTestCase):
+
+    backend = "sharded"
+
+    def test_stamp_changes_when_titles_are_added(self):
+        stamp = util.backend().stamp()
+        self.assertEqual(util.backend().stamp(), stamp)
+        util.save_entry("Python", "A language.\n")
+        added = util.backend().stamp()
+        self.assertNotEqual(added, stamp)
+        util.save_entry("Python", "A programming language.\n")
+        self.assertEqual(util.backend().stamp(), added)
+        util.save_entry("Django", "A framework.\n")
+        self.assertEqual(sorted(util.backend().list_titles()), ["Django", "Python"])
+        self.assertEqual(util.list_entries(), ["Django", "Python"])
+
+
+class SQLiteBackendTests(WikiTestCase):
+
+    backend = "sqlite"
+
+    def test_search(self):
+        util.save_entry("Python", "Python is a programming language.")
+        util.save_entry("Django", "Django is a web framework written in Python.")
+        util.save_entry("HTML", "HTML is a markup language.")
+        search = util.backend().search
+        self.assertEqual([title for title, _ in search("framework")], ["Django"])
+        self.assertEqual({title for title, _ in search("language")}, {"Python", "HTML"})
+        self.assertEqual(search("python")[0][0], "Python")
+        self.assertIn("markup", search("markup")[0][1])
+        self.assertEqual(search("NOT OR"), [])
+        self.assertEqual(search("!!"), [])
+
+        # Replaced content is searched instead of the old one
+        util.save_entry("HTML", "HTML describes web pages.")
+        self.assertEqual([title for title, _ in search("markup")], [])
+        self.assertEqual({title for title, _ in search("web")}, {"Django", "HTML"})
+
+
+class MoveEntriesTests(WikiTestCase):
+
+    entries = {
+        "Python": "# Python\n\nA language.\n",
+        "Crème brûlée": "Windows line endings\r\nand unicode: é\r\n",
+        "Empty": "",
+    }
+
+    def test_round_trip(self):
+        for title, content in self.entries.items():
+            util.save_entry(title, content)
+        for source, target in (("flat", "sqlite"), ("sqlite", "sharded"), ("sharded", "sqlite")):
+            out = io.StringIO()
+            call_command("move_entries", source, target, batch_size=2, stdout=out)
+            self.assertIn(f"Copied {len(self.entries)} entries.", out.getvalue())
+            backend = get_backend(target)
+            self.assertEqual(sorted(backend.list_titles()), sorted(self.entries))
+            for title, content in self.entries.items():
+                self.assertEqual(backend.get(title), content)
+        # The source is left as it was
+        self.assertEqual(sorted(get_backend("flat").list_titles()), sorted(self.entries))
+
+    def test_benchmark(self):
+        out = io.StringIO()
+        call_command("benchmark_backends", entries=20, reads=5, stdout=out)
+        for name in ("flat", "sharded", "sqlite"):
+            self.assertIn(name, out.getvalue())
+
+
+class RendererTests(WikiTestCase):
+
+    def test_headings(self):
+        self.assertEqual(renderer.render("# One\n###### Six\n####### Seven\n#NoSpace"),
+                         "<h1>One</h1>\n<h6>Six</h6>\n<p>####### Seven</p>\n<p>#NoSpace</p>")
+
+    def test_lists(self):
+        self.assertEqual(renderer.render("1. one\n2. two\n1.no space"),
+                         "<ol><li>one</li>\n<li>two</li>\n</ol><p>1.no space</p>")
+        self.assertEqual(renderer.render("- a\n* b\n+ c"),
+                         "<ul><li>a</li>\n<li>b</li>\n<li>c</li>\n</ul>")
+
+    def test_lists_closed(self):
+        # By a list of the other type, a paragraph, a heading or a blank line
+        self.assertEqual(renderer.render("1. one\n- a\ntext"),
+                         "<ol><li>one</li>\n</ol><ul><li>a</li>\n</ul><p>text</p>")
+        self.assertEqual(renderer.render("- a\n# H"), "<ul><li>a</li>\n</ul><h1>H</h1>")
+        self.assertEqual(renderer.render("- a\n\n- b"),
+                         "<ul><li>a</li>\n</ul>\n<ul><li>b</li>\n</ul>")
+
+    def test_inline(self):
+        self.assertEqual(renderer.render("**bold**, *italic* and [Python](/wiki/Python/)"),
+                         '<p><b>bold</b>, <i>italic</i> and <a href="/wiki/Python/">Python</a></p>')
+        self.assertEqual(renderer.render("- **a** [b](/c)"),
+                         '<ul><li><b>a</b> <a href="/c">b</a></li>\n</ul>')
+
+    def test_benchmark(self):
+        out = io.StringIO()
+        call_command("benchmark_renderer", pages=2, lines=20, stdout=out)
+        self.assertIn("pages/s", out.getvalue())
+
+    def test_cache_is_bounded(self):
+        renderer._cache.clear()
+        with mock.patch.object(renderer, "CACHE_SIZE", 3):
+            for i in range(5):
+                renderer.render_entry(f"Page {i}", f"# Page {i}")
+            renderer.render_entry("Page 2", "# Page 2")
+            renderer.render_entry("Page 5", "# Page 5")
+        self.assertEqual(list(renderer._cache), ["Page 4", "Page 2", "Page 5"])
+        self.assertEqual(renderer.render_entry("Page 2", "# Changed"), "<h1>Changed</h1>")
+
+
+class TitleIndexTests(WikiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        for title in ("Python", "django", "HTML", "CSS"):
+            util.save_entry(title, f"# {title}")
+
+    def test_lookups(self):
+        self.assertEqual(util.list_entries(), ["CSS", "HTML", "Python", "django"])
+        self.assertEqual(util.find_entry("PYTHON"), "Python")
+        self.assertEqual(util.find_entry("Django"), "django")
+        self.assertIsNone(util.find_entry("Git"))
+        self.assertIn(util.random_entry(), util.list_entries())
+        self.assertEqual(util.search_titles("t"), ["HTML", "Python"])
+        self.assertEqual(util.search_titles("THO"), ["Python"])
+
+    def test_follows_outside_changes(self):
+        self.write_outside("Git", "# Git")
+        self.assertEqual(util.find_entry("git"), "Git")
+        os.remove(default_storage.path(util.backend()._filename("CSS")))
+        self.assertEqual(util.list_entries(), ["Git", "HTML", "Python", "django"])
+        self.assertIsNone(util.find_entry("css"))
+
+
+class TrigramTests(WikiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        for title in ("Python", "Django", "HTML", "CSS", "Git", "JavaScript"):
+            util.save_entry(title, f"# {title}")
+
+    def test_short_queries_match_prefixes_only(self):
+        self.assertEqual(util.suggest_titles("j"), ["JavaScript"])
+        self.assertEqual(util.suggest_titles("S"), [])
+        self.assertEqual(util.suggest_titles("ja"), ["JavaScript"])
+        self.assertEqual(util.suggest_titles("jan"), ["Django"])
+        self.assertEqual(util.suggest_titles("ava"), ["JavaScript"])
+
+    def test_save_replaces_trigram_sets(self):
+        before = util._trigrams["pyt"]
+        util.save_entry("Pythonic", "# Pythonic")
+        self.assertEqual(before, {"Python"})
+        self.assertEqual(util._trigrams["pyt"], {"Python", "Pythonic"})
+        self.assertEqual(util.search_titles("pyth"), ["Python", "Pythonic"])
+
+    def test_search_titles_agrees_with_a_scan(self):
+        for query in ("a", "av", "ava", "javas", "ml", "xyz", "SCRIPT"):
+            self.assertEqual(util.search_titles(query),
+                             sorted(title for title in util.list_entries()
+                                    if query.casefold() in title.casefold()), query)
+
+    def test_similar_titles(self):
+        self.assertEqual(util.similar_titles("Pyton"), ["Python"])
+        self.assertEqual(util.similar_titles("Pyhton"), [])
+        self.assertEqual(util.similar_titles("javascrip"), ["JavaScript"])
+        self.assertEqual(util.similar_titles("zzzz"), [])
+
+
+class EntryViewTests(WikiTestCase):
+
+    backend = "sqlite"
+
+    def test_content_read_once_per_view(self):
+        util.save_entry("Python", "# Python\n\nA language.\n")
+        backend = util.backend()
+        with mock.patch.object(backend, "get", wraps=backend.get) as get:
+            response = self.client.get("/wiki/Python/")
+            self.assertContains(response, "<h1>Python</h1>")
+            # Once for the ETag and once to render the page
+            self.assertEqual(get.call_count, 2)
+            get.reset_mock()
+            response = self.client.get("/wiki/Python/")
+            self.assertContains(response, "<h1>Python</h1>")
+            self.assertEqual(get.call_count, 1)
+
+
+class ConditionalGetTests(WikiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        util.save_entry("Python", "# Python")
+
+    def test_etag(self):
+        response = self.client.get("/wiki/Python/")
+        etag = response["ETag"]
+        response = self.client.get("/wiki/Python/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+
+        # Let the modification time move on
+        time.sleep(0.01)
+        util.save_entry("Python", "# Python 3")
+        response = self.client.get("/wiki/Python/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "<h1>Python 3</h1>")
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_last_modified(self):
+        response = self.client.get("/wiki/Python/")
+        modified = response["Last-Modified"]
+        response = self.client.get("/wiki/Python/", HTTP_IF_MODIFIED_SINCE=modified)
+        self.assertEqual(response.status_code, 304)
+
+    def test_missing_entry(self):
+        response = self.client.get("/wiki/Git/", HTTP_IF_NONE_MATCH="*")
+        self.assertEqual(response.status_code, 302)
+
+
+class StreamingTests(WikiTestCase):
+
+    content = "# Big page\n\n" + "".join(f"- item {i} with **bold** text\n" for i in range(200))
+
+    def setUp(self):
+        super().setUp()
+        util.save_entry("Big", self.content)
+
+    def test_matches_rendered_page(self):
+        page = self.client.get("/wiki/Big/")
+        self.assertNotIsInstance(page, StreamingHttpResponse)
+        with override_settings(STREAMING_THRESHOLD=100):
+            response = self.client.get("/wiki/Big/")
+        self.assertIsInstance(response, StreamingHttpResponse)
+        self.assertEqual(b"".join(response.streaming_content), page.content)
+
+    @override_settings(STREAMING_THRESHOLD=100)
+    def test_not_modified(self):
+        response = self.client.get("/wiki/Big/")
+        b"".join(response.streaming_content)
+        response = self.client.get("/wiki/Big/", HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+
+
+class RevisionTests(WikiTestCase):
+
+    def test_round_trip(self):
+        versions = [
+            "# Python\n\nA language.\n",
+            "# Python\n\nA programming language.\n\nSee also: Django\n",
+            "# Python\n\n\n\nSee also: Django\n",
+            "",
+            "# Python\n" + "\n" * (revisions.DIFF_LINES + 10) + "The end\n",
+        ]
+        for content in versions:
+            util.save_entry("Python", content)
+        for number, content in enumerate(versions, 1):
+            self.assertEqual(revisions.get_revision("Python", number), content)
+        self.assertEqual(len(revisions.list_revisions("Python")), len(versions))
+
+    def test_changed_outside_save_entry(self):
+        util.save_entry("Python", "one\ntwo\n")
+        self.write_outside("Python", "one\nthree\n")
+        util.save_entry("Python", "one\nthree\nfour\n")
+        self.assertEqual([revisions.get_revision("Python", number) for number in (1, 2, 3)],
+                         ["one\ntwo\n", "one\nthree\n", "one\nthree\nfour\n"])
+
+    def test_concurrent_saves(self):
+        util.save_entry("Python", "start\n")
+        last_digest = revisions._last_digest
+
+        def slow_last_digest(title):
+            # Leave time for another save to read the same old version
+            digest = last_digest(title)
+            time.sleep(0.01)
+            return digest
+
+        contents = [f"start\nline {i}\n" * (i + 1) for i in range(8)]
+        threads = [threading.Thread(target=util.save_entry, args=("Python", content))
+                   for content in contents]
+        with mock.patch.object(revisions, "_last_digest", slow_last_digest):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        # Every revision must replay onto the one before it
+        history = revisions._read("Python")
+        self.assertEqual(len(history), len(contents) + 1)
+        for number in range(1, len(history) + 1):
+            content = revisions.get_revision("Python", number)
+            self.assertEqual(revisions._digest(content), history[number - 1]["sha1"])
+        self.assertEqual(revisions.get_revision("Python", len(history)),
+                         util.get_entry("Python"))
+
+
+class SearchIndexTests(WikiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        util.save_entry("Python", "Python is a programming language. Python is fun.")
+        util.save_entry("Django", "Django is a web framework written in Python.")
+        util.save_entry("HTML", "HTML is a markup language.")
+
+    def test_built_offline(self):
+        self.assertEqual(util.search_entries("language"), [])
+        util.rebuild_search_index()
+        self.assertEqual([title for title, _ in util.search_entries("python")],
+                         ["Python", "Django"])
+        self.assertEqual([title for title, _ in util.search_entries("markup python")][-1],
+                         "Django")
+
+    def test_follows_saves_and_outside_changes(self):
+        util.rebuild_search_index()
+        util.save_entry("CSS", "CSS styles markup.")
+        self.write_outside("Git", "Git tracks changes to markup and code.")
+        os.remove(default_storage.path(util.backend()._filename("HTML")))
+        self.assertEqual(sorted(title for title, _ in util.search_entries("markup")),
+                         ["CSS", "Git"])
+
+    def test_top_results_are_exact(self):
+        for i in range(60):
+            util.save_entry(f"Page {i}", "python " * (i % 7 + 1) + "django " * (i % 5 + 1) +
+                            "filler " * (i % 11))
+        util.rebuild_search_index()
+        query = "python django"
+        scores = {}
+        conn = fulltext._connection()
+        count = fulltext._stat(conn, "documents")
+        for term in ("python", "django"):
+            df = conn.execute("SELECT df FROM terms WHERE term = ?", (term,)).fetchone()[0]
+            idf = math.log(1 + (count - df + 0.5) / (df + 0.5))
+            for title, weight in conn.execute(
+                    "SELECT title, weight FROM postings WHERE term = ?", (term,)):
+                scores[title] = scores.get(title, 0) + idf * weight
+        expected = sorted(scores.values(), reverse=True)[:5]
+        self.assertEqual([round(score, 9) for _, score in fulltext.search(query, 5)],
+                         [round(score, 9) for score in expected])
+
+
+class ArchiveTests(WikiTestCase):
+
+    entries = {
+        "Python": "# Python\n\nA language.\n",
+        "Crème brûlée": "Windows line endings\r\nand unicode: é\r\n",
+        "Empty": "",
+    }
+
+    def setUp(self):
+        super().setUp()
+        for title, content in self.entries.items():
+            util.save_entry(title, content)
+
+    def wipe(self):
+        shutil.rmtree(default_storage.path("entries"))
+        os.makedirs(default_storage.path("entries"))
+        self.reset()
+
+    def round_trip(self, name, **options):
+        path = os.path.join(default_storage.path(""), name)
+        call_command("export_entries", path, stdout=io.StringIO(), **options)
+        self.wipe()
+        self.assertEqual(util.list_entries(), [])
+        call_command("import_entries", path, stdout=io.StringIO(), **options)
+
+        # The title index was rebuilt by the import, before any lookup
+        self.assertEqual(util._titles, sorted(self.entries))
+        self.assertEqual(util.find_entry("crème BRÛLÉE"), "Crème brûlée")
+        self.assertEqual(util.suggest_titles("pyt"), ["Python"])
+        for title, content in self.entries.items():
+            self.assertEqual(util.get_entry(title), content)
+
+    def test_tar(self):
+        self.round_trip("entries.tar")
+
+    def test_tar_gz(self):
+        self.round_trip("entries.tar.gz")
+
+    def test_jsonl(self):
+        self.round_trip("entries.jsonl")
+
+    def test_jsonl_gz(self):
+        self.round_trip("entries.jsonl.gz")
+
+    def test_bad_titles_skipped(self):
+        path = os.path.join(default_storage.path(""), "bad.jsonl")
+        with open(path, "w", encoding="utf-8") as f:
+            for title in ("Git", "", "a/b"):
+                f.write(json.dumps({"title": title, "content": "x"}) + "\n")
+        stderr = io.StringIO()
+        call_command("import_entries", path, stdout=io.StringIO(), stderr=stderr)
+        self.assertIn("Skipped 2 entries", stderr.getvalue())
+        self.assertEqual(util.find_entry("git"), "Git")
@@ -6,7 +6,10 @@ urlpatterns = [
     path("", views.index, name="index"),
     path('create', views.create, name='create'),
     path('edit/<str:title>/', views.edit, name='edit'),
+    path('history/<str:title>/', views.history, name='history'),
+    path('history/<str:title>/<int:number>/', views.revision, name='revision'),
     path('search/', views.search, name='search'),
+    path('search/suggest/', views.suggest, name='suggest'),
     path('random/', views.random_page, name='random_page'),
     path('wiki/<str:title>/', views.entry, name='entry')
 ]
@@ -1,28 +1,252 @@
-import re
+import bisect
+import hashlib
+import random
+import threading
 
-from django.core.files.base import ContentFile
-from django.core.files.storage import default_storage
+from django.core.cache import cache
+
+from . import fulltext, revisions
+from .backends import get_backend
+
+
+# Where the entries are stored, see settings.ENTRIES_BACKEND
+_backend = None
+
+# Process-wide title index: a sorted list of titles, a casefolded
+# lookup dict and a trigram index for substring and fuzzy matching,
+# rebuilt only when the stored entries change.
+_lock = threading.Lock()
+_titles = []
+_lookup = {}
+_folded = []
+_trigrams = {}
+_stamp = None
+
+
+def _grams(text):
+    """
+    Returns the set of three-character substrings of the text.
+    """
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _padded_grams(text):
+    """
+    Returns the trigrams of the text including its start and end, so
+    that short titles still have a few trigrams to match on.
+    """
+    return _grams(f"  {text} ")
+
+
+def _index_trigrams(trigrams, title):
+    for gram in _padded_grams(title.casefold()):
+        trigrams.setdefault(gram, set()).add(title)
+
+
+def _add_trigrams(trigrams, title):
+    """
+    Indexes one more title by replacing the sets it belongs in instead
+    of changing them, as searches may be iterating them without a lock.
+    """
+    for gram in _padded_grams(title.casefold()):
+        trigrams[gram] = trigrams.get(gram, set()) | {title}
+
+
+def backend():
+    """
+    Returns the configured entry storage backend.
+    """
+    global _backend
+    if _backend is None:
+        _backend = get_backend()
+    return _backend
+
+
+def _refresh_index():
+    """
+    Rebuilds the title index if the stored entries have been changed
+    by anything other than save_entry.
+    """
+    global _titles, _lookup, _folded, _trigrams, _stamp
+    stamp = backend().stamp()
+    if stamp == _stamp:
+        return
+    with _lock:
+        if stamp == _stamp:
+            return
+        titles = sorted(backend().list_titles())
+        trigrams = {}
+        for title in titles:
+            _index_trigrams(trigrams, title)
+        _lookup = {title.casefold(): title for title in titles}
+        _folded = sorted(_lookup)
+        _trigrams = trigrams
+        _titles = titles
+        _stamp = stamp
+
+
+def _add_to_index(title, fresh):
+    """
+    Adds a newly saved title to the index without listing all
+    entries again. If the index was up to date before the write, it is
+    marked as up to date again.
+    """
+    global _stamp
+    with _lock:
+        if title.casefold() not in _lookup:
+            bisect.insort(_titles, title)
+            bisect.insort(_folded, title.casefold())
+            _lookup[title.casefold()] = title
+            _add_trigrams(_trigrams, title)
+        if fresh:
+            _stamp = backend().stamp()
 
 
 def list_entries():
     """
     Returns a list of all names of encyclopedia entries.
     """
-    _, filenames = default_storage.listdir("entries")
-    return list(sorted(re.sub(r"\.md$", "", filename)
-                for filename in filenames if filename.endswith(".md")))
+    _refresh_index()
+    return list(_titles)
+
+
+def find_entry(title):
+    """
+    Returns the stored title matching the given one case-insensitively,
+    or None if there is no such entry.
+    """
+    _refresh_index()
+    return _lookup.get(title.casefold())
+
+
+def random_entry():
+    """
+    Returns the title of a random entry, or None if there are none.
+    """
+    _refresh_index()
+    titles = _titles
+    return random.choice(titles) if titles else None
+
+
+def search_titles(query):
+    """
+    Returns the sorted titles containing the query, ignoring case.
+    """
+    _refresh_index()
+    query = query.casefold()
+    grams = _grams(query)
+    if not grams:
+        return [title for title in _titles if query in title.casefold()]
+
+    # Only titles sharing every trigram of the query can contain it
+    postings = sorted((_trigrams.get(gram, set()) for gram in grams), key=len)
+    candidates = set.intersection(*postings)
+    return sorted(title for title in candidates if query in title.casefold())
+
+
+def suggest_titles(query, limit=10):
+    """
+    Returns up to `limit` titles for autocompletion: titles starting
+    with the query first, then titles containing it. Queries shorter
+    than a trigram only match the start of titles, since nearly every
+    title contains them.
+    """
+    _refresh_index()
+    query = query.casefold()
+    if not query:
+        return []
+    suggestions = []
+    start = bisect.bisect_left(_folded, query)
+    for folded in _folded[start:start + limit]:
+        if not folded.startswith(query):
+            break
+        suggestions.append(_lookup[folded])
+    if len(suggestions) < limit and len(query) >= 3:
+        for title in search_titles(query):
+            if title not in suggestions:
+                suggestions.append(title)
+                if len(suggestions) == limit:
+                    break
+    return suggestions
+
+
+def similar_titles(query, limit=5, threshold=0.3):
+    """
+    Returns up to `limit` titles that look like the query, for "did you
+    mean" suggestions, ranked by trigram similarity.
+    """
+    _refresh_index()
+    grams = _padded_grams(query.casefold())
+    shared = {}
+    for gram in grams:
+        for title in _trigrams.get(gram, ()):
+            shared[title] = shared.get(title, 0) + 1
+
+    scored = []
+    for title, count in shared.items():
+        total = len(grams) + len(_padded_grams(title.casefold())) - count
+        score = count / total
+        if score >= threshold:
+            scored.append((score, title))
+    scored.sort(key=lambda item: (-item[0], item[1]))
+    return [title for _, title in scored[:limit]]
+
+
+def valid_title(title):
+    """
+    Returns True if the title can be used as a file name and URL part:
+    not empty and without path separators or "..".
+    """
+    return bool(title) and not any(part in title for part in ("/", "\\", ".."))
 
 
 def save_entry(title, content):
     """
     Saves an encyclopedia entry, given its title and Markdown
     content. If an existing entry with the same title already exists,
-    it is replaced.
+    it is replaced. Raises ValueError for titles valid_title rejects.
     """
-    filename = f"entries/{title}.md"
-    if default_storage.exists(filename):
-        default_storage.delete(filename)
-    default_storage.save(filename, ContentFile(content))
+    if not valid_title(title):
+        raise ValueError(f"Invalid entry title: {title!r}")
+    _refresh_index()
+    _stamp_before = backend().stamp()
+    fresh = _stamp_before == _stamp
+    # Read, save and record one save of this title at a time
+    with revisions.lock(title):
+        old = backend().get(title)
+        backend().save(title, content)
+        revisions.record(title, old, content)
+    cache.delete(page_cache_key(title))
+    _add_to_index(title, fresh)
+    if not hasattr(backend(), "search") and fulltext.is_built():
+        fulltext.index_entry(title, content)
+        if fulltext.stamp() == str(_stamp_before):
+            fulltext.set_stamp(backend().stamp())
+
+
+def save_entries(entries):
+    """
+    Saves a batch of (title, content) pairs at once. Unlike save_entry,
+    no revisions are recorded and the title index is left to be rebuilt
+    once with rebuild_index after the last batch.
+    """
+    entries = list(entries)
+    for title, _ in entries:
+        if not valid_title(title):
+            raise ValueError(f"Invalid entry title: {title!r}")
+    backend().save_many(entries)
+    if not hasattr(backend(), "search") and fulltext.is_built():
+        fulltext.index_entries(entries)
+    cache.delete_many([page_cache_key(title) for title, _ in entries])
+
+
+def rebuild_index():
+    """
+    Rebuilds the title index from the stored entries right away.
+    """
+    global _stamp
+    _stamp = None
+    _refresh_index()
 
 
 def get_entry(title):
@@ -30,8 +254,90 @@ def get_entry(title):
     Retrieves an encyclopedia entry by its title. If no such
     entry exists, the function returns None.
     """
-    try:
-        f = default_storage.open(f"entries/{title}.md")
-        return f.read().decode("utf-8")
-    except FileNotFoundError:
-        return None
+    return backend().get(title)
+
+
+def open_entry(title):
+    """
+    Opens an encyclopedia entry for reading line by line. If no such
+    entry exists, the function returns None.
+    """
+    return backend().open(title)
+
+
+def entry_size(title):
+    """
+    Returns the size of an entry in bytes, or None if it does not exist.
+    """
+    return backend().size(title)
+
+
+def entry_etag(title):
+    """
+    Returns a string that changes whenever the entry changes, or None
+    if it does not exist.
+    """
+    return backend().etag(title)
+
+
+def entry_modified(title):
+    """
+    Returns when the entry was last changed, or None if unknown.
+    """
+    return backend().modified(title)
+
+
+def page_cache_key(title):
+    """
+    Returns the cache key of an entry's rendered page.
+    """
+    return "encyclopedia:page:" + hashlib.sha1(title.encode("utf-8")).hexdigest()
+
+
+def rebuild_search_index():
+    """
+    Builds the full-text index from all entries. Run it once with the
+    build_search_index command; save_entry keeps the index up to date
+    afterwards.
+    """
+    if hasattr(backend(), "search"):
+        return
+    stamp = backend().stamp()
+    fulltext.rebuild((title, get_entry(title)) for title in list_entries())
+    fulltext.set_stamp(stamp)
+
+
+def _sync_search_index():
+    """
+    Indexes the entries added and removed by anything other than
+    save_entry since the index was last known to be up to date.
+    """
+    stamp = backend().stamp()
+    if fulltext.stamp() == str(stamp):
+        return
+    titles = set(list_entries())
+    indexed = set(fulltext.titles())
+    fulltext.index_entries([(title, get_entry(title)) for title in titles - indexed] +
+                           [(title, None) for title in indexed - titles])
+    fulltext.set_stamp(stamp)
+
+
+def search_entries(query, limit=20):
+    """
+    Searches the content of all entries. Returns a list of
+    (title, snippet) pairs, best match first, or an empty list until
+    the search index has been built.
+    """
+    # The SQLite backend has its own full-text index
+    if hasattr(backend(), "search"):
+        return backend().search(query, limit)
+
+    if not fulltext.is_built():
+        return []
+    _sync_search_index()
+    results = []
+    for title, _ in fulltext.search(query, limit):
+        content = get_entry(title)
+        if content is not None:
+            results.append((title, fulltext.snippet(content, query)))
+    return results
@@ -1,10 +1,12 @@
+from django.conf import settings
 from django.contrib import messages
-from django.http import Http404, HttpResponseRedirect
+from django.core.cache import cache
+from django.http import Http404, HttpResponse, HttpResponseRedirect, JsonResponse, StreamingHttpResponse
 from django.shortcuts import redirect, render
+from django.template.loader import render_to_string
 from django.urls import reverse
-from . import util
-import random
-import re
+from django.views.decorators.http import condition
+from . import renderer, revisions, util
 
 def index(request):
     return render(request, "encyclopedia/index.html", {
@@ -12,50 +14,114 @@ def index(request):
     })
 
 
+def entry_etag(request, title):
+    # Computed once per request, for both @condition and the page cache
+    if not hasattr(request, 'entry_etag'):
+        request.entry_etag = util.entry_etag(title)
+    return request.entry_etag
+
+
+def entry_modified(request, title):
+    return util.entry_modified(title)
+
+
+# Answer 304 Not Modified when the client has the current version
+@condition(etag_func=entry_etag, last_modified_func=entry_modified)
 def entry(request, title):
     """Render the file"""
+    # Send very large pages while they are being rendered
+    size = util.entry_size(title)
+    if size is not None and size > settings.STREAMING_THRESHOLD:
+        return stream_entry(request, title)
+
+    # Reuse the rendered page if the entry has not changed since
+    key = util.page_cache_key(title)
+    etag = entry_etag(request, title)
+    cached = cache.get(key)
+    if etag is not None and cached is not None and cached[0] == etag:
+        return HttpResponse(cached[1])
+
     entry_content = util.get_entry(title)
     if entry_content is None:
         # Raise an error message
         messages.error(request, 'Page not Found.')
         return HttpResponseRedirect(reverse('index'))
     # Convert .md to html
-    html_content = markdown_to_html(entry_content)
-    return render(request, 'encyclopedia/entry.html', {
+    html_content = renderer.render_entry(title, entry_content)
+    response = render(request, 'encyclopedia/entry.html', {
         'title': title,
         'content': html_content
     })
+    cache.set(key, (etag, response.content), settings.PAGE_CACHE_TIMEOUT)
+    return response
+
+
+def stream_entry(request, title):
+    """Render a large file block by block"""
+    entry_file = util.open_entry(title)
+    if entry_file is None:
+        messages.error(request, 'Page not Found.')
+        return HttpResponseRedirect(reverse('index'))
+
+    # Render the page around a marker and send the content in between
+    marker = '<!-- content -->'
+    page = render_to_string('encyclopedia/entry.html', {
+        'title': title,
+        'content': marker
+    }, request=request)
+    head, tail = page.split(marker, 1)
+
+    def chunks():
+        with entry_file:
+            yield head
+            yield from renderer.stream(entry_file)
+            yield tail
+
+    return StreamingHttpResponse(chunks())
 
 
 def search(request):
     """Search all the files"""
     # Get the value of input field
     query = request.GET.get('q', '')
-    all_entries = util.list_entries()
-    for item in all_entries:
-        if query.lower() == item.lower():
-            # Render the appropriate page
-            return entry(request, item)
+    item = util.find_entry(query)
+    if item is not None:
+        # Render the appropriate page
+        return entry(request, item)
 
     # If no page found show a search result
-    results = [entry for entry in util.list_entries() if query.lower() in entry.lower()]
+    results = util.search_titles(query)
+    # Search inside the pages as well
+    matches = util.search_entries(query)
+    # Suggest close titles if nothing matched
+    similar = [] if results or matches else util.similar_titles(query)
     return render(request, 'encyclopedia/search_results.html', {
         'query': query,
-        'results': results
+        'results': results,
+        'matches': matches,
+        'similar': similar
     })
 
 
+def suggest(request):
+    """Autocomplete titles for the search box"""
+    query = request.GET.get('q', '')
+    return JsonResponse({'results': util.suggest_titles(query)})
+
+
 def create(request):
     """Create new pages"""
     if request.method == 'POST':
         title = request.POST.get('title')
+        # Titles become file names and URL parts
+        if not util.valid_title(title):
+            messages.error(request, 'Titles cannot be empty or contain "/", "\\" or "..".')
+            return HttpResponseRedirect(reverse('index'))
         # Check if the same title exists
-        entries = util.list_entries()
-        for entry in entries:
-            if title.lower() == entry.lower():
-                # Raise an error message
-                messages.error(request, 'A page with this title already exists.')
-                return HttpResponseRedirect(reverse('index'))
+        if util.find_entry(title) is not None:
+            # Raise an error message
+            messages.error(request, 'A page with this title already exists.')
+            return HttpResponseRedirect(reverse('index'))
         content = request.POST.get('content')
         # Save the new page using utility functions
         util.save_entry(title, content)
@@ -66,6 +132,8 @@ def create(request):
 
 def edit(request, title):
     """Edit pages"""
+    if not util.valid_title(title):
+        raise Http404('Page not found.')
     if request.method == 'POST':
         content = request.POST.get('content')
         util.save_entry(title, content)
@@ -78,66 +146,31 @@ def edit(request, title):
         })
     
 
-def random_page(request):
-    """Go to random page"""
-    entries = util.list_entries()
-    random_entry = random.choice(entries)
-    return redirect('entry', title=random_entry)
+def history(request, title):
+    """List the revisions of a page"""
+    return render(request, 'encyclopedia/history.html', {
+        'title': title,
+        'revisions': reversed(revisions.list_revisions(title))
+    })
 
 
-def markdown_to_html(content):
-    """Convert .md to HTML"""
-    lines = content.split('\n')
-    in_ol = False
-    in_ul = False
-    for j in range(len(lines)):
-        for i in range(6, 0, -1):
-            if lines[j].startswith('#' * i + ' '):
-                lines[j] = f'<h{i}>' + lines[j][i+1:] + f'</h{i}>'
-                break
-        else:
-            # Numbered lists
-            if re.match(r'^\d+\. ', lines[j]):
-                if not in_ol:
-                    lines[j] = '<ol>' + f'<li>{lines[j][lines[j].index(" ") + 1:]}</li>'
-                    in_ol = True
-                else:
-                    lines[j] = f'<li>{lines[j][lines[j].index(" ") + 1:]}</li>'
-            else:
-                if in_ol:
-                    lines[j-1] += '</ol>'
-                    in_ol = False
-
-            # Bullet lists
-            if re.match(r'^[\*\-\+] ', lines[j]):
-                if not in_ul:
-                    lines[j] = '<ul>' + f'<li>{lines[j][2:]}</li>'
-                    in_ul = True
-                else:
-                    lines[j] = f'<li>{lines[j][2:]}</li>'
-            else:
-                if in_ul:
-                    lines[j-1] += '</ul>'
-                    in_ul = False
-
-            # Paragraphs
-                elif lines[j].strip():  # Check if the line is not empty
-                    lines[j] = f'<p>{lines[j]}</p>'
-        
-        # Bold text
-        lines[j] = re.sub(r'\*\*(.*?)\*\*', r'<b>\1</b>', lines[j])
-        # Italic text
-        lines[j] = re.sub(r'\*(.*?)\*', r'<i>\1</i>', lines[j])
-
-    if in_ol:
-        lines[-1] += '</ol>'
-    if in_ul:
-        lines[-1] += '</ul>'
-    
-    # Join lines into a single string
-    content = '\n'.join(lines)
+def revision(request, title, number):
+    """Render an old revision of a page"""
+    content = revisions.get_revision(title, number)
+    if content is None:
+        raise Http404('Revision not found.')
+    return render(request, 'encyclopedia/entry.html', {
+        'title': title,
+        'content': renderer.render(content),
+        'revision': number
+    })
 
-    # Links
-    content = re.sub(r'\[([^\]]+)\]\(([^)]+)\)', r'<a href="\2">\1</a>', content)
 
-    return content
\ No newline at end of file
+def random_page(request):
+    """Go to random page"""
+    random_entry = util.random_entry()
+    if random_entry is None:
+        messages.error(request, 'There are no pages yet.')
+        return HttpResponseRedirect(reverse('index'))
+    return redirect('entry', title=random_entry)
+
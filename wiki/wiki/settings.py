@@ -119,3 +119,32 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/3.0/howto/static-files/
 
 STATIC_URL = '/static/'
+
+
+# Where encyclopedia entries are stored: "flat" (entries/<title>.md),
+# "sharded" (entries/<xx>/<title>.md) or "sqlite" (ENTRIES_DATABASE).
+
+ENTRIES_BACKEND = 'flat'
+
+ENTRIES_DATABASE = os.path.join(BASE_DIR, 'entries.sqlite3')
+
+
+# Entries larger than this many bytes are rendered and sent in chunks
+
+STREAMING_THRESHOLD = 1024 * 1024
+
+
+# Seconds a rendered entry page is kept in the cache. Pages are also
+# dropped from the cache when the entry is saved.
+
+PAGE_CACHE_TIMEOUT = 60 * 60
+
+
+# Append-only edit history of every entry
+
+REVISIONS_ROOT = os.path.join(BASE_DIR, 'revisions')
+
+
+# Full-text search index over the encyclopedia entries
+
+SEARCH_INDEX = os.path.join(BASE_DIR, 'search_index.sqlite3')